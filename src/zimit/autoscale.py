@@ -0,0 +1,213 @@
+"""
+Adaptive crawler workers
+
+Periodically measure host CPU load, available memory, memory used by the crawler
+browsers and time spent per page, and restart the crawler from its saved state with
+a better number of workers when needed
+"""
+
+import json
+import os
+import signal
+import subprocess
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from zimit.constants import EXIT_CODE_CRAWLER_INTERRUPTED, logger
+from zimit.resume import get_latest_crawl_state
+
+# load average per CPU above which workers are removed, below which some are added
+CPU_LOAD_HIGH = 0.9
+CPU_LOAD_LOW = 0.6
+# share of host memory available below which workers are removed, above which some
+# are added
+MEMORY_AVAILABLE_LOW = 0.15
+MEMORY_AVAILABLE_HIGH = 0.4
+# increase of time spent per page (by each worker) considered as a contention
+LATENCY_DEGRADATION = 1.25
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def get_cpu_load() -> float:
+    """Load average over last minute, per CPU"""
+    return os.getloadavg()[0] / (os.cpu_count() or 1)
+
+
+def get_memory_info() -> tuple[int, int]:
+    """Total and available host memory, in bytes"""
+    meminfo = {}
+    for line in Path("/proc/meminfo").read_text().splitlines():
+        name, value = line.split(":", 1)
+        meminfo[name] = int(value.split()[0]) * 1024
+    return meminfo["MemTotal"], meminfo["MemAvailable"]
+
+
+def get_process_tree_rss(pid: int) -> int:
+    """RSS of process pid and all its descendants (browsers), in bytes"""
+    parents: dict[int, int] = {}
+    rss: dict[int, int] = {}
+    for stat_path in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            stat = stat_path.read_text()
+        except OSError:
+            # process has exited
+            continue
+        # fields after command name (which might hold spaces), starting with state
+        fields = stat[stat.rindex(")") + 2 :].split()
+        process = int(stat_path.parent.name)
+        parents[process] = int(fields[1])
+        rss[process] = int(fields[21]) * PAGE_SIZE
+    tree = {pid}
+    while children := {
+        process
+        for process, parent in parents.items()
+        if parent in tree and process not in tree
+    }:
+        tree |= children
+    return sum(rss.get(process, 0) for process in tree)
+
+
+def set_crawler_arg(crawler_args: list[str], option: str, value: str) -> list[str]:
+    """Crawler command line with option set to value, replacing any previous value"""
+    args = []
+    crawler_args_iter = iter(crawler_args)
+    for arg in crawler_args_iter:
+        if arg == option:
+            next(crawler_args_iter)
+        else:
+            args.append(arg)
+    return [*args, option, value]
+
+
+class WorkersAutoscaler:
+    """Choose number of crawler workers, between min_workers and max_workers, from
+    host load and crawler progress read in stats_path"""
+
+    def __init__(self, min_workers: int, max_workers: int, stats_path: Path):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.stats_path = stats_path
+        self.previous_latency: float | None = None
+        self.reset()
+
+    def reset(self):
+        """Restart page latency measurement, e.g. after crawler restart"""
+        self.last_crawled: tuple[int, float] | None = None
+
+    def get_page_latency(self, workers: int, now: float) -> float | None:
+        """Average time spent by a worker on a page since previous call"""
+        try:
+            crawled = json.loads(self.stats_path.read_bytes())["crawled"]
+        except (OSError, ValueError, KeyError) as exc:
+            logger.debug(f"Crawler statistics not available: {exc}")
+            return None
+        last_crawled, self.last_crawled = self.last_crawled, (crawled, now)
+        if not last_crawled or crawled <= last_crawled[0]:
+            return None
+        return workers * (now - last_crawled[1]) / (crawled - last_crawled[0])
+
+    def measure(self, pid: int, workers: int, now: float | None = None):
+        """Current host load and crawler (running as pid) resources usage"""
+        memory_total, memory_available = get_memory_info()
+        return {
+            "cpu_load": get_cpu_load(),
+            "memory_total": memory_total,
+            "memory_available": memory_available,
+            "browsers_rss": get_process_tree_rss(pid),
+            "page_latency": self.get_page_latency(workers, now or time.monotonic()),
+        }
+
+    def get_target_workers(self, workers: int, sample: dict[str, float | None]) -> int:
+        """Number of workers to use, given current one and a measure of load"""
+        memory_total = sample["memory_total"] or 1
+        memory_available = (sample["memory_available"] or 0) / memory_total
+        cpu_load = sample["cpu_load"] or 0
+        latency = sample["page_latency"]
+        degraded = bool(
+            latency
+            and self.previous_latency
+            and latency > self.previous_latency * LATENCY_DEGRADATION
+        )
+        if latency:
+            self.previous_latency = latency
+
+        if memory_available < MEMORY_AVAILABLE_LOW or cpu_load > CPU_LOAD_HIGH:
+            target = workers - max(1, workers // 4)
+        elif (
+            memory_available > MEMORY_AVAILABLE_HIGH
+            and cpu_load < CPU_LOAD_LOW
+            and not degraded
+        ):
+            # only add workers whose browsers fit in memory left available
+            worker_rss = (sample["browsers_rss"] or 0) / workers
+            affordable = (
+                int(
+                    (memory_available - MEMORY_AVAILABLE_LOW)
+                    * memory_total
+                    / worker_rss
+                )
+                if worker_rss
+                else workers
+            )
+            target = workers + min(max(1, workers // 2), affordable)
+        else:
+            target = workers
+        return max(self.min_workers, min(self.max_workers, target))
+
+
+def run_adaptive_crawl(
+    crawler_args: list[str],
+    build_dir: Path,
+    autoscaler: WorkersAutoscaler,
+    *,
+    workers: int,
+    interval: float,
+    on_start: Callable[[subprocess.Popen], None] | None = None,
+) -> int:
+    """Run crawler, restarting it from its saved state whenever autoscaler picks
+    another number of workers (checked every interval seconds)
+
+    on_start is called with each crawler process once started. Returns the exit
+    code of the crawl.
+    """
+    while True:
+        crawler_args = set_crawler_arg(crawler_args, "--workers", str(workers))
+        logger.info(f"Running crawler with {workers} workers")
+        process = subprocess.Popen(crawler_args)
+        if on_start:
+            on_start(process)
+        autoscaler.reset()
+        try:
+            while True:
+                try:
+                    return process.wait(timeout=interval)
+                except subprocess.TimeoutExpired:
+                    pass
+                sample = autoscaler.measure(process.pid, workers)
+                target = autoscaler.get_target_workers(workers, sample)
+                if target != workers:
+                    break
+        except BaseException:
+            # same as subprocess.run, do not leave crawler running behind us
+            process.kill()
+            process.wait()
+            raise
+
+        logger.info(
+            f"Restarting crawler with {target} workers instead of {workers} "
+            f"(load: {sample['cpu_load']:.2f}, available memory: "
+            f"{sample['memory_available']} bytes, browsers RSS: "
+            f"{sample['browsers_rss']} bytes)"
+        )
+        interrupted_at = time.time()
+        process.send_signal(signal.SIGINT)
+        returncode = process.wait()
+        crawl_state = get_latest_crawl_state(build_dir)
+        if returncode not in (0, EXIT_CODE_CRAWLER_INTERRUPTED) or (
+            not crawl_state or crawl_state.stat().st_mtime < interrupted_at
+        ):
+            # crawl failed or completed before being interrupted
+            return returncode
+        crawler_args = set_crawler_arg(crawler_args, "--config", str(crawl_state))
+        workers = target
@@ -0,0 +1,152 @@
+"""
+Batch mode
+
+Run many zimit jobs described in a JSONL manifest from a single zimit process, jobs
+being forked from a server which has already imported zimit and warc2zim
+"""
+
+import json
+import multiprocessing
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any
+
+from zimit.constants import logger
+from zimit.timings import PhaseTimer
+
+# modules imported once by the fork server, before any job is started
+PRELOADED_MODULES = ["zimit.zimit", "warc2zim.main"]
+
+
+def get_job_args(args: list[str] | dict[str, Any]) -> list[str]:
+    """zimit arguments of a job, given as a list or as a mapping of option to value
+
+    In a mapping, True values are flags, False and None values are ignored and list
+    values repeat the option.
+    """
+    if isinstance(args, list):
+        return [str(arg) for arg in args]
+    job_args = []
+    for option, value in args.items():
+        for item in value if isinstance(value, list) else [value]:
+            if item is None or item is False:
+                continue
+            job_args.append(f"--{option}")
+            if item is not True:
+                job_args.append(str(item))
+    return job_args
+
+
+def load_manifest(path: Path) -> list[dict[str, Any]]:
+    """Jobs of a JSONL manifest, one JSON object with `args` (and optional `id`) per
+    line"""
+    jobs = []
+    ids = set()
+    with open(path) as fh:
+        for lineno, line in enumerate(fh, start=1):
+            if not line.strip():
+                continue
+            try:
+                spec = json.loads(line)
+                job = {
+                    "id": str(spec.get("id", f"job-{lineno}")),
+                    "args": get_job_args(spec["args"]),
+                }
+            except (ValueError, KeyError, TypeError, AttributeError) as exc:
+                raise ValueError(f"Invalid job at {path}:{lineno}: {exc!r}") from None
+            if job["id"] in ids:
+                raise ValueError(f"Duplicate job id at {path}:{lineno}: {job['id']}")
+            ids.add(job["id"])
+            jobs.append(job)
+    return jobs
+
+
+def run_job(args: list[str]) -> tuple[int, dict[str, Any]]:
+    """Run a zimit job, in a process of the pool
+
+    Returns its exit code and timing report
+    """
+    from zimit.zimit import run  # noqa: PLC0415
+
+    timer = PhaseTimer()
+    try:
+        # in-process warc2zim returns None once the ZIM has been created ; pool
+        # processes exit without running atexit handlers, so temporary files are
+        # deleted as soon as the job is over
+        returncode = run(args, timer, cleanup_at_exit=False) or 0
+    except SystemExit as exc:
+        returncode = exc.code if isinstance(exc.code, int) else 1
+    finally:
+        timer.stop()
+    return returncode, timer.get_report()
+
+
+def run_batch(raw_args: list[str]) -> int:
+    parser = ArgumentParser(
+        prog="zimit batch",
+        description="Run many zimit jobs described in a JSONL manifest. Other "
+        "arguments are passed to every job, before its own arguments.",
+    )
+    parser.add_argument(
+        "manifest",
+        type=Path,
+        help="JSONL file with one job per line: a JSON object with zimit arguments "
+        "as `args` (a list, or a mapping of option to value) and an optional `id`, "
+        'e.g. {"id": "example", "args": {"seeds": "https://example.com", "name": '
+        '"example"}}',
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of jobs running at the same time. Default is 1.",
+    )
+    parser.add_argument(
+        "--results",
+        type=Path,
+        help="JSONL file where result and timings of each job are written once it "
+        "has completed. Default is the manifest path with .results.jsonl suffix",
+    )
+    args, common_args = parser.parse_known_args(raw_args)
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be a positive integer")
+    try:
+        jobs = load_manifest(args.manifest)
+    except (OSError, ValueError) as exc:
+        parser.error(str(exc))
+    results_path = args.results or args.manifest.with_suffix(".results.jsonl")
+
+    logger.info(
+        f"Running {len(jobs)} jobs from {args.manifest}, {args.concurrency} at a time"
+    )
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(PRELOADED_MODULES)
+    nb_failed = 0
+    with (
+        ProcessPoolExecutor(
+            max_workers=args.concurrency, mp_context=context, max_tasks_per_child=1
+        ) as executor,
+        open(results_path, "w") as results,
+    ):
+        futures = {
+            executor.submit(run_job, [*common_args, *job["args"]]): job for job in jobs
+        }
+        for future in as_completed(futures):
+            job = futures[future]
+            result = {"id": job["id"], "args": job["args"]}
+            try:
+                result["returncode"], result["timings"] = future.result()
+            except Exception as exc:
+                result["returncode"] = None
+                result["error"] = repr(exc)
+            if result["returncode"] != 0:
+                nb_failed += 1
+            logger.info(f"Job {job['id']} completed with {result['returncode']}")
+            results.write(json.dumps(result) + "\n")
+            results.flush()
+
+    logger.info(f"{len(jobs) - nb_failed} jobs succeeded, {nb_failed} failed")
+    logger.info(f"Jobs results written to {results_path}")
+    return 1 if nb_failed else 0
@@ -0,0 +1,82 @@
+"""
+Conversion checkpoint
+
+Keep track, in the build directory, of conversion inputs already prepared (WARC files
+downloaded and / or extracted from --warcs) so that a rerun with the same build
+directory does not prepare them again
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import Any
+
+from zimit.constants import logger
+from zimit.progress import write_json_atomically
+
+MANIFEST_VERSION = 1
+
+
+def get_fingerprint(path: Path) -> dict[str, int]:
+    """Size of all files at path (a file or a directory), per relative path"""
+    if path.is_file():
+        return {path.name: path.stat().st_size}
+    return {
+        str(fpath.relative_to(path)): fpath.stat().st_size
+        for fpath in sorted(path.rglob("*"))
+        if fpath.is_file()
+    }
+
+
+def get_source_fingerprint(location: str) -> dict[str, int] | None:
+    """Size and modification time of a local --warcs location, None for URLs"""
+    if re.match(r"^https?\://", location):
+        return None
+    stat = Path(location).stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class ConversionManifest:
+    """Conversion inputs prepared in the build directory, stored as JSON
+
+    Each --warcs location is mapped to the WARC file or directory prepared from it,
+    with sizes of its files so that incomplete or altered inputs are not reused
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.inputs: dict[str, dict[str, Any]] = {}
+        if not self.path.exists():
+            return
+        try:
+            manifest = json.loads(self.path.read_text())
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.inputs = manifest["inputs"]
+        except (OSError, ValueError, KeyError) as exc:
+            logger.warning(f"Ignoring invalid conversion manifest {self.path}: {exc}")
+
+    def get(self, location: str) -> Path | None:
+        """Path prepared for location by a previous run, if still valid"""
+        entry = self.inputs.get(location)
+        if not entry:
+            return None
+        path = Path(entry["path"])
+        try:
+            source_unchanged = entry["source"] == get_source_fingerprint(location)
+            if source_unchanged and entry["files"] == get_fingerprint(path):
+                return path
+        except OSError:
+            pass
+        logger.info(f"Input prepared for {location} has changed, preparing it again")
+        return None
+
+    def add(self, location: str, path: Path):
+        """Record that path has been prepared for location"""
+        self.inputs[location] = {
+            "path": str(path),
+            "source": get_source_fingerprint(location),
+            "files": get_fingerprint(path),
+        }
+        write_json_atomically(
+            self.path, {"version": MANIFEST_VERSION, "inputs": self.inputs}
+        )
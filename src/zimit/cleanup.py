@@ -0,0 +1,88 @@
+"""
+Temporary files cleanup
+
+Delete huge temporary directories quickly: the directory is first renamed aside, so
+that it is gone at once for anyone looking at it, then files are deleted by many
+threads, optionally in a detached process so that zimit does not wait for them
+"""
+
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from zimit.constants import logger
+
+# prefix of directories renamed aside before being deleted
+DELETING_PREFIX = ".zimit-deleting-"
+# deleting files is bound by filesystem metadata operations, not by CPU
+DELETE_WORKERS = 16
+
+
+def rename_aside(path: Path) -> Path:
+    """Rename path next to itself, with a name showing it is being deleted"""
+    aside = path.with_name(f"{DELETING_PREFIX}{path.name}")
+    path.rename(aside)
+    return aside
+
+
+def _unlink_all(dirpath: str, names: list[str]) -> int:
+    nb_deleted = 0
+    for name in names:
+        try:
+            os.unlink(os.path.join(dirpath, name))
+            nb_deleted += 1
+        except FileNotFoundError:
+            pass
+    return nb_deleted
+
+
+def delete_tree(path: Path, max_workers: int = DELETE_WORKERS) -> int:
+    """Delete path and all its content, files of each directory being deleted in
+    parallel
+
+    Returns the number of files deleted
+    """
+    dirs = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirs.append(dirpath)
+            # symbolic links to directories are not followed, only deleted
+            links = [
+                name for name in dirnames if os.path.islink(os.path.join(dirpath, name))
+            ]
+            if filenames or links:
+                futures.append(
+                    executor.submit(_unlink_all, dirpath, [*filenames, *links])
+                )
+        nb_deleted = sum(future.result() for future in futures)
+    # directories are empty now, children being removed before their parent
+    for dirpath in reversed(dirs):
+        os.rmdir(dirpath)
+    return nb_deleted
+
+
+def delete_in_background(path: Path) -> subprocess.Popen:
+    """Delete path in a detached process, which logs once deletion is complete"""
+    return subprocess.Popen(
+        [sys.executable, "-m", "zimit.cleanup", str(path)],
+        stdin=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def main():
+    path = Path(sys.argv[1])
+    start = time.monotonic()
+    nb_deleted = delete_tree(path)
+    logger.info(
+        f"Cleanup of {path} completed: {nb_deleted} files deleted in "
+        f"{time.monotonic() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,21 @@ import logging
 from zimscraperlib.logging import getLogger
 
 EXIT_CODE_WARC2ZIM_CHECK_FAILED = 2
+EXIT_CODE_CRAWLER_INTERRUPTED = 11
 EXIT_CODE_CRAWLER_SIZE_LIMIT_HIT = 14
 EXIT_CODE_CRAWLER_TIME_LIMIT_HIT = 15
 NORMAL_WARC2ZIM_EXIT_CODE = 100
 REQUESTS_TIMEOUT = 10
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DEFAULT_DOWNLOAD_CONCURRENCY = 4
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_BACKOFF_FACTOR = 2
+PREFETCH_CHUNKS = 16
+# crawl share of the whole work, until it can be estimated from measured throughput
+DEFAULT_CRAWL_SHARE = 0.9
+# rough warc2zim throughput (bytes of WARC per second), to estimate conversion time
+CONVERSION_BYTES_RATE = 10 * 1024 * 1024
+# duration (in seconds) over which throughputs are measured
+RATE_WINDOW = 60
 
 logger = getLogger(name="zimit", level=logging.INFO)
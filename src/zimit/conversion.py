@@ -0,0 +1,219 @@
+"""
+warc2zim conversion helpers
+
+Allow to check warc2zim arguments cheaply and to run warc2zim in a dedicated child
+process instead of inside zimit one
+"""
+
+import hashlib
+import importlib.metadata
+import json
+import os
+import resource
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from zimit.constants import NORMAL_WARC2ZIM_EXIT_CODE, logger
+from zimit.progress import write_json_atomically
+
+
+def get_default_cache_dir() -> Path:
+    """Directory where zimit caches data across runs"""
+    return Path(os.getenv("XDG_CACHE_HOME", "") or Path.home() / ".cache") / "zimit"
+
+
+def _get_arg_value(args: list[str], name: str) -> str | None:
+    """Value of a given argument in args, if present"""
+    if name not in args or args.index(name) + 1 >= len(args):
+        return None
+    return args[args.index(name) + 1]
+
+
+def get_zim_path(warc2zim_args: list[str]) -> Path | None:
+    """Path of the ZIM warc2zim will create, None if it cannot be determined"""
+    output = Path(_get_arg_value(warc2zim_args, "--output") or ".")
+    zim_file = _get_arg_value(warc2zim_args, "--zim-file")
+    name = _get_arg_value(warc2zim_args, "--name")
+    if not zim_file and not name:
+        return None
+    return output / (zim_file or f"{name}_{{period}}.zim").format(
+        period=time.strftime("%Y-%m")
+    )
+
+
+def get_zim_name(warc2zim_args: list[str]) -> str | None:
+    """Name of the ZIM warc2zim will create (--zim-file or --name), not formatted"""
+    return _get_arg_value(warc2zim_args, "--zim-file") or _get_arg_value(
+        warc2zim_args, "--name"
+    )
+
+
+def _output_state_is_valid(warc2zim_args: list[str]) -> bool:
+    """Cheap version of warc2zim checks which depend on the output directory state
+
+    Returns False whenever warc2zim might reject the output directory or ZIM file
+    """
+    output = Path(_get_arg_value(warc2zim_args, "--output") or ".")
+    if not output.is_dir() or not os.access(output, os.W_OK):
+        return False
+    if "--overwrite" in warc2zim_args:
+        return True
+    zim_path = get_zim_path(warc2zim_args)
+    return zim_path is not None and not zim_path.exists()
+
+
+def check_warc2zim_args(warc2zim_args: list[str], cache_dir: Path) -> int:
+    """Check warc2zim arguments, without any input
+
+    Since warc2zim has no dedicated API to validate its arguments, it is ran without
+    any input, which returns NORMAL_WARC2ZIM_EXIT_CODE if arguments are valid. This
+    requires to load the whole warc2zim conversion stack, so successful checks are
+    cached in cache_dir per hash of arguments and warc2zim version. On cache hit,
+    only cheap checks of the output directory state are ran again, warc2zim being
+    ran should they fail so that it reports the exact problem.
+    """
+    key = hashlib.sha256(
+        json.dumps([importlib.metadata.version("warc2zim"), warc2zim_args]).encode()
+    ).hexdigest()
+    cache_file = cache_dir / f"warc2zim-check-{key}"
+    if cache_file.exists() and _output_state_is_valid(warc2zim_args):
+        logger.info("warc2zim args already checked successfully")
+        return NORMAL_WARC2ZIM_EXIT_CODE
+
+    from warc2zim.main import main as warc2zim  # noqa: PLC0415
+
+    res = warc2zim(warc2zim_args)
+    if res == NORMAL_WARC2ZIM_EXIT_CODE:
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            cache_file.touch()
+        except OSError as exc:
+            logger.debug(f"Failed to cache warc2zim args check: {exc}")
+    return res
+
+
+class ProgressPipeReader:
+    """Forward warc2zim progress received over a named pipe to progress file
+
+    warc2zim rewrites its whole progress file for every record ; the named pipe is
+    kept open by the reader so that warc2zim never blocks opening it, and JSON
+    documents received are decoded from the stream as they arrive.
+    """
+
+    def __init__(self, fifo_path: Path, progress_path: Path):
+        self.fifo_path = fifo_path
+        self.progress_path = progress_path
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.fifo_path.unlink(missing_ok=True)
+        os.mkfifo(self.fifo_path)
+        self.read_fd = os.open(self.fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+        # our own write end avoids EOF (and busy looping) between warc2zim writes
+        self.write_fd = os.open(self.fifo_path, os.O_WRONLY)
+        self.thread = threading.Thread(target=self.forward, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.thread:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+        self.fifo_path.unlink(missing_ok=True)
+
+    def forward(self):
+        decoder = json.JSONDecoder()
+        buffer = ""
+        while True:
+            readable, _, _ = select.select([self.read_fd], [], [], 0.5)
+            if not readable:
+                if self.stop_event.is_set():
+                    return
+                continue
+            buffer += os.read(self.read_fd, 65536).decode()
+            latest = None
+            while buffer := buffer.lstrip():
+                try:
+                    latest, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    # incomplete document, wait for more data
+                    break
+                buffer = buffer[end:]
+            if latest is not None:
+                write_json_atomically(self.progress_path, latest)
+
+
+def run_warc2zim_process(
+    warc2zim_args: list[str],
+    pipe_dir: Path,
+    *,
+    max_memory: int | None = None,
+    max_cpu_time: int | None = None,
+) -> int:
+    """Run warc2zim in a child process, with optional resource limits
+
+    max_memory is the maximum address space (in bytes) and max_cpu_time the maximum
+    CPU time (in seconds) warc2zim is allowed to use.
+
+    If a progress file is requested in warc2zim_args, progress is received over a
+    named pipe created in pipe_dir and written to the progress file by zimit.
+
+    Returns warc2zim exit code, or 128 + signal number if it has been killed by a
+    signal (e.g. SIGKILL or SIGXCPU when limits are exceeded)
+    """
+
+    args = list(warc2zim_args)
+    progress_reader = None
+    if "--progress-file" in args:
+        idx = args.index("--progress-file") + 1
+        progress_reader = ProgressPipeReader(
+            pipe_dir / "warc2zim-progress.fifo", Path(args[idx])
+        )
+        progress_reader.start()
+        args[idx] = str(progress_reader.fifo_path)
+
+    logger.info(
+        "Running warc2zim in a child process"
+        + (f", memory limited to {max_memory} bytes" if max_memory else "")
+        + (f", CPU time limited to {max_cpu_time}s" if max_cpu_time else "")
+    )
+    try:
+        with subprocess.Popen(
+            [sys.executable, "-m", "warc2zim.main", *args]
+        ) as process:
+            try:
+                # limits are set from here and not in the child before exec
+                # (preexec_fn), which might deadlock as zimit runs other threads ;
+                # warc2zim is still starting the interpreter at this point
+                if max_memory:
+                    resource.prlimit(
+                        process.pid, resource.RLIMIT_AS, (max_memory, max_memory)
+                    )
+                if max_cpu_time:
+                    resource.prlimit(
+                        process.pid,
+                        resource.RLIMIT_CPU,
+                        (max_cpu_time, max_cpu_time),
+                    )
+                process.wait()
+            except BaseException:
+                # same as subprocess.run, do not leave warc2zim running
+                process.kill()
+                raise
+    finally:
+        if progress_reader:
+            progress_reader.stop()
+
+    if process.returncode < 0:
+        signum = -process.returncode
+        logger.error(f"warc2zim has been killed by {signal.Signals(signum).name}")
+        return 128 + signum
+    return process.returncode
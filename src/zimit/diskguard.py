@@ -0,0 +1,118 @@
+"""
+Disk budget guard
+
+Watch disk space used by the build directory and left on its volume during the
+crawl, gracefully stopping the crawler before the volume is exhausted, and delete
+intermediate files as soon as they are not needed anymore
+"""
+
+import shutil
+import signal
+import subprocess
+import threading
+from collections.abc import Callable, Iterable
+from pathlib import Path
+
+from zimit.constants import logger
+from zimit.metrics import get_disk_usage
+
+# seconds between two checks of disk usage
+DISK_GUARD_INTERVAL = 10
+
+
+class CrawlerProcesses:
+    """Crawler processes (crawler, crawler shards) to stop once disk is exhausted"""
+
+    def __init__(self):
+        self.processes: list[subprocess.Popen] = []
+        self.interrupted = False
+        self.lock = threading.Lock()
+
+    def add(self, process: subprocess.Popen):
+        """Track a crawler process, interrupted at once if crawl is being stopped"""
+        with self.lock:
+            self.processes.append(process)
+            if self.interrupted:
+                self._interrupt(process)
+
+    def interrupt(self):
+        """Gracefully stop all crawler processes, current and future ones"""
+        with self.lock:
+            self.interrupted = True
+            for process in self.processes:
+                self._interrupt(process)
+
+    @staticmethod
+    def _interrupt(process: subprocess.Popen):
+        # crawler stops gracefully on SIGINT, writing its WARC files
+        if process.poll() is None:
+            logger.info(f"Interrupting crawler process {process.pid}")
+            process.send_signal(signal.SIGINT)
+
+
+def delete_artifacts(paths: Iterable[Path]) -> int:
+    """Delete files or directories not needed anymore, returning bytes freed"""
+    freed = 0
+    for path in paths:
+        if not path.exists():
+            continue
+        usage = get_disk_usage(path) if path.is_dir() else path.stat().st_blocks * 512
+        logger.info(f"Deleting {path}, not needed anymore ({usage} bytes)")
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+        freed += usage
+    return freed
+
+
+class DiskGuard:
+    """Call on_exhausted once build_dir uses more than budget bytes, or less than
+    reserve bytes are free on its volume, checking every interval seconds"""
+
+    def __init__(
+        self,
+        build_dir: Path,
+        on_exhausted: Callable[[], None],
+        *,
+        budget: int | None = None,
+        reserve: int | None = None,
+        interval: float = DISK_GUARD_INTERVAL,
+    ):
+        self.build_dir = build_dir
+        self.on_exhausted = on_exhausted
+        self.budget = budget
+        self.reserve = reserve
+        self.interval = interval
+        self.exhausted = False
+        self.stop_event = threading.Event()
+        self.thread: threading.Thread | None = None
+
+    def check(self) -> str | None:
+        """Reason why disk is (about to be) exhausted, None if it is not"""
+        if self.budget:
+            usage = get_disk_usage(self.build_dir)
+            if usage >= self.budget:
+                return f"build directory uses {usage} bytes (budget: {self.budget})"
+        if self.reserve:
+            free = shutil.disk_usage(self.build_dir).free
+            if free <= self.reserve:
+                return f"{free} bytes left on volume (reserve: {self.reserve})"
+        return None
+
+    def watch(self):
+        self.thread = threading.Thread(target=self._watch, daemon=True)
+        self.thread.start()
+
+    def _watch(self):
+        while not self.stop_event.wait(self.interval):
+            if reason := self.check():
+                logger.warning(f"Disk budget exhausted: {reason}, stopping crawl")
+                self.exhausted = True
+                self.on_exhausted()
+                return
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
@@ -0,0 +1,185 @@
+"""
+Metrics exposition
+
+Expose zimit metrics in Prometheus text format over HTTP, fed by the same stats
+sources as progress files (crawler stats, warc2zim progress and --warcs downloads)
+"""
+
+import os
+import threading
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from zimit.constants import logger
+
+# metrics name and help ; all metrics are gauges
+METRICS = {
+    "zimit_phase_duration_seconds": "Wall time spent in each phase so far",
+    "zimit_progress_done": "Work done, see zimit progress file",
+    "zimit_progress_total": "Total work, see zimit progress file",
+    "zimit_eta_seconds": "Estimated remaining time",
+    "zimit_crawl_pages_crawled": "Pages crawled",
+    "zimit_crawl_pages_total": "Pages discovered",
+    "zimit_crawl_pages_pending": "Pages being crawled",
+    "zimit_crawl_pages_failed": "Pages which failed to be crawled",
+    "zimit_crawl_warc_bytes": "Bytes of WARC written by the crawler",
+    "zimit_crawl_pages_per_second": "Pages crawled per second",
+    "zimit_crawl_warc_bytes_per_second": "Bytes of WARC written per second",
+    "zimit_conversion_records_written": "Records converted by warc2zim",
+    "zimit_conversion_records_total": "Records to convert by warc2zim",
+    "zimit_conversion_records_per_second": "Records converted per second",
+    "zimit_download_bytes_done": "Bytes of --warcs downloaded",
+    "zimit_download_bytes_total": "Bytes of --warcs to download",
+    "zimit_download_bytes_per_second": "Bytes of --warcs downloaded per second",
+    "zimit_temp_dir_bytes": "Disk usage of zimit temporary directory",
+}
+
+
+def get_disk_usage(path: Path) -> int:
+    """Bytes of disk used by all files below path"""
+    usage = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                usage += os.lstat(os.path.join(dirpath, filename)).st_blocks * 512
+            except OSError:
+                # file removed meanwhile
+                continue
+    return usage
+
+
+class Metrics:
+    """Latest value of zimit metrics, updated from progress stats"""
+
+    def __init__(
+        self,
+        temp_dir: Path | None = None,
+        get_phase_durations: Callable[[], dict[str, float]] | None = None,
+    ):
+        self.temp_dir = temp_dir
+        self.get_phase_durations = get_phase_durations
+        self.values: dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def update(self, progress: dict[str, Any], data: dict[str, Any] | None = None):
+        """Update metrics from zimit progress stats and raw data they derive from"""
+        data = data or {}
+        phase = progress.get("phase")
+        values = {
+            "zimit_progress_done": progress.get("done"),
+            "zimit_progress_total": progress.get("total"),
+            "zimit_eta_seconds": progress.get("eta_seconds"),
+        }
+        if phase == "crawl":
+            values.update(
+                {
+                    "zimit_crawl_pages_crawled": data.get("crawled"),
+                    "zimit_crawl_pages_total": data.get("total"),
+                    "zimit_crawl_pages_pending": data.get("pending"),
+                    "zimit_crawl_pages_failed": data.get("failed"),
+                    "zimit_crawl_warc_bytes": progress.get("warc_bytes"),
+                }
+            )
+        elif phase == "conversion":
+            values.update(
+                {
+                    "zimit_conversion_records_written": data.get("written"),
+                    "zimit_conversion_records_total": data.get("total"),
+                }
+            )
+        elif phase == "download":
+            values.update(
+                {
+                    "zimit_download_bytes_done": progress.get("done"),
+                    "zimit_download_bytes_total": progress.get("total"),
+                }
+            )
+        for name, rate in progress.get("rates", {}).items():
+            values[f"zimit_{phase}_{name}"] = rate
+        with self.lock:
+            self.values.update(
+                {
+                    name: value
+                    for name, value in values.items()
+                    if name in METRICS and value is not None
+                }
+            )
+
+    def render(self) -> str:
+        """Metrics in Prometheus text exposition format"""
+        with self.lock:
+            values: dict[str, Any] = dict(self.values)
+        if self.get_phase_durations:
+            values["zimit_phase_duration_seconds"] = {
+                f'phase="{phase}"': duration
+                for phase, duration in self.get_phase_durations().items()
+            }
+        if self.temp_dir:
+            values["zimit_temp_dir_bytes"] = get_disk_usage(self.temp_dir)
+
+        lines = []
+        for name, help_text in METRICS.items():
+            if name not in values:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            if isinstance(values[name], dict):
+                lines.extend(
+                    f"{name}{{{labels}}} {value}"
+                    for labels, value in values[name].items()
+                )
+            else:
+                lines.append(f"{name} {values[name]}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serve metrics over HTTP at /metrics, from a background thread"""
+
+    def __init__(self, metrics: Metrics, port: int, host: str = ""):
+        # only imported when serving, since it is slow to import
+        from http.server import (  # noqa: PLC0415
+            BaseHTTPRequestHandler,
+            ThreadingHTTPServer,
+        )
+
+        self.metrics = metrics
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8"
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # noqa: A002, ARG002
+                # do not pollute zimit logs with every scrape
+                return
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self) -> int:
+        return int(self.server.server_address[1])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Serving metrics at http://localhost:{self.port}/metrics")
+
+    def stop(self):
+        if not self.thread:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
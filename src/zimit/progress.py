@@ -0,0 +1,267 @@
+"""
+Progress reporting
+
+Aggregate crawler and warc2zim progress files into zimit progress file
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+from zimit.constants import (
+    CONVERSION_BYTES_RATE,
+    DEFAULT_CRAWL_SHARE,
+    RATE_WINDOW,
+    logger,
+)
+from zimit.metrics import Metrics
+
+
+def write_json_atomically(fpath: Path, data: Any):
+    """Write data as JSON to fpath, atomically replacing it
+
+    Readers of fpath hence never see an empty or partially written file
+    """
+    tmp_fpath = fpath.with_name(
+        f".{fpath.name}.{os.getpid()}-{threading.get_ident()}.tmp"
+    )
+    tmp_fpath.write_text(json.dumps(data))
+    os.replace(tmp_fpath, fpath)
+
+
+class RateMeter:
+    """Measure throughput of an increasing counter over a sliding window (seconds)"""
+
+    min_samples = 2
+
+    def __init__(self, window: float = RATE_WINDOW):
+        self.window = window
+        self.samples: deque[tuple[float, float]] = deque()
+
+    def update(self, value: float, now: float):
+        self.samples.append((now, value))
+        # keep at least two samples, the oldest one being at least window old
+        while (
+            len(self.samples) > self.min_samples
+            and now - self.samples[1][0] >= self.window
+        ):
+            self.samples.popleft()
+
+    @property
+    def rate(self) -> float | None:
+        """Counter increase per second, None until measurable"""
+        if len(self.samples) < self.min_samples:
+            return None
+        (start, start_value), (end, end_value) = self.samples[0], self.samples[-1]
+        if end <= start:
+            return None
+        return max(end_value - start_value, 0) / (end - start)
+
+
+class ProgressModel:
+    """Estimate zimit progress and remaining time from measured throughput
+
+    Crawl throughput is measured in pages and WARC bytes per second. Conversion
+    time is estimated from the WARC volume expected at the end of the crawl and
+    conversion_bytes_rate, until warc2zim is running and its throughput (records per
+    second) can be measured.
+
+    Overall done / total are expressed in crawled pages then warc2zim records, the
+    crawl share of the whole work being its share of (estimated) time. WARC bytes
+    are the ones found under warcs_paths (collections of all crawler shards).
+    """
+
+    def __init__(
+        self,
+        warcs_paths: Iterable[Path] = (),
+        conversion_bytes_rate: float = CONVERSION_BYTES_RATE,
+    ):
+        self.warcs_paths = list(warcs_paths)
+        self.conversion_bytes_rate = conversion_bytes_rate
+        self.pages = RateMeter()
+        self.warc_bytes = RateMeter()
+        self.records = RateMeter()
+        self.crawl_share = DEFAULT_CRAWL_SHARE
+        self.crawl_start: float | None = None
+
+    def get_warc_bytes(self) -> int:
+        return sum(
+            fpath.stat().st_size
+            for warcs_path in self.warcs_paths
+            if warcs_path.exists()
+            for fpath in warcs_path.rglob("*.warc*")
+            if fpath.is_file()
+        )
+
+    def crawl_progress(
+        self, data: dict[str, Any], now: float | None = None
+    ) -> dict[str, Any]:
+        now = time.monotonic() if now is None else now
+        if self.crawl_start is None:
+            self.crawl_start = now
+        crawled, total = data["crawled"], data["total"]
+        warc_bytes = self.get_warc_bytes()
+        self.pages.update(crawled, now)
+        self.warc_bytes.update(warc_bytes, now)
+
+        eta = None
+        pages_rate = self.pages.rate
+        if pages_rate:
+            crawl_eta = (total - crawled) / pages_rate
+            # WARC volume at the end of the crawl, extrapolated from current one
+            expected_bytes = warc_bytes * total / crawled if crawled else warc_bytes
+            conversion_eta = expected_bytes / self.conversion_bytes_rate
+            crawl_duration = now - self.crawl_start + crawl_eta
+            if crawl_duration > 0:
+                self.crawl_share = crawl_duration / (crawl_duration + conversion_eta)
+            eta = crawl_eta + conversion_eta
+
+        return {
+            "done": crawled,
+            "total": int(total / self.crawl_share),
+            "phase": "crawl",
+            "eta_seconds": _round(eta),
+            "warc_bytes": warc_bytes,
+            "rates": {
+                "pages_per_second": pages_rate,
+                "warc_bytes_per_second": self.warc_bytes.rate,
+            },
+        }
+
+    def warc2zim_progress(
+        self, data: dict[str, Any], now: float | None = None
+    ) -> dict[str, Any]:
+        now = time.monotonic() if now is None else now
+        written, total = data["written"], data["total"]
+        self.records.update(written, now)
+
+        records_rate = self.records.rate
+        return {
+            "done": int(
+                total
+                * (
+                    self.crawl_share
+                    + (1 - self.crawl_share) * (float(written) / total if total else 1)
+                )
+            ),
+            "total": total,
+            "phase": "conversion",
+            "eta_seconds": _round(
+                (total - written) / records_rate if records_rate else None
+            ),
+            "rates": {"records_per_second": records_rate},
+        }
+
+
+def _round(value: float | None) -> int | None:
+    return None if value is None else round(value)
+
+
+class ProgressFileWatcher:
+    """Aggregate crawler and warc2zim progress into zimit progress file
+
+    Runs in a thread of zimit process. Crawler / warc2zim progress files are only
+    read once closed after writing (or moved into place), and updates are coalesced:
+    zimit progress file is rewritten (atomically) at most once per interval (in
+    seconds), from the latest content of modified files. Files which cannot be
+    parsed (e.g. being rewritten again meanwhile) are read again on next update.
+    """
+
+    def __init__(
+        self,
+        crawl_stats_path: Path,
+        warc2zim_stats_path: Path,
+        zimit_stats_path: Path,
+        *,
+        interval: float = 1,
+        warcs_paths: Iterable[Path] = (),
+        metrics: Metrics | None = None,
+    ):
+        self.crawl_stats_path = crawl_stats_path
+        self.warc2zim_stats_path = warc2zim_stats_path
+        self.zimit_stats_path = zimit_stats_path
+        self.interval = interval
+        self.model = ProgressModel(warcs_paths)
+        self.metrics = metrics
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def watch(self):
+        import inotify.adapters  # noqa: PLC0415
+
+        # watches are added before returning so that no modification made once we
+        # return is missed, and so that setup errors are raised to the caller
+        ino = inotify.adapters.Inotify(block_duration_s=min(self.interval, 1))
+        # parent directories are watched since files replaced atomically are new
+        # inodes, which would not be watched anymore
+        for directory in {
+            str(Path(fpath).parent)
+            for fpath in (self.crawl_stats_path, self.warc2zim_stats_path)
+        }:
+            ino.add_watch(
+                directory,
+                inotify.constants.IN_CLOSE_WRITE  # pyright: ignore
+                | inotify.constants.IN_MOVED_TO,  # pyright: ignore
+            )
+        self.thread = threading.Thread(
+            target=self.inotify_watcher, args=(ino,), daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        """Stop watching, once pending modifications have been written"""
+        if not self.thread:
+            return
+        self.stop_event.set()
+        self.thread.join()
+
+    def inotify_watcher(self, ino):
+        # process crawler before warc2zim so that latest phase wins when both changed
+        converters = {
+            str(self.crawl_stats_path): self.model.crawl_progress,
+            str(self.warc2zim_stats_path): self.model.warc2zim_progress,
+        }
+
+        pending: set[str] = set()
+        last_write = 0.0
+        for event in ino.event_gen(yield_nones=True):
+            if event is not None:
+                _, _, path, filename = event
+                if (fpath := str(Path(path) / filename)) in converters:
+                    pending.add(fpath)
+            stopping = self.stop_event.is_set()
+            if pending and (stopping or time.monotonic() - last_write >= self.interval):
+                pending = self.update(
+                    [
+                        (fpath, func)
+                        for fpath, func in converters.items()
+                        if fpath in pending
+                    ]
+                )
+                last_write = time.monotonic()
+            if stopping and event is None:
+                return
+
+    def update(self, sources) -> set[str]:
+        """Write zimit progress from sources ; returns files which could not be read"""
+        out = None
+        failed = set()
+        for fpath, func in sources:
+            try:
+                data = json.loads(Path(fpath).read_text())
+                out = func(data)
+            except Exception as exc:  # nosec
+                # might be malformed input for instance
+                logger.debug(f"Failed to read progress of {fpath}: {exc}")
+                failed.add(fpath)
+                continue
+            if self.metrics:
+                self.metrics.update(out, data)
+        if out:
+            write_json_atomically(self.zimit_stats_path, out)
+        return failed
@@ -0,0 +1,80 @@
+"""
+Crash-resumable runs
+
+Locate the build directory of a previous (interrupted) run of the same job, the
+latest crawl state saved by the crawler in it and whether its crawl has already
+completed
+"""
+
+import json
+from pathlib import Path
+from typing import Any
+
+from zimit.constants import logger
+from zimit.progress import write_json_atomically
+
+CRAWL_COMPLETE_MARKER = "crawl-complete.json"
+# identity (seeds, ZIM name) of the job a build directory belongs to
+JOB_FILE = "job.json"
+
+
+def write_job(build_dir: Path, job: dict[str, Any]):
+    """Record in build_dir the identity of the job it belongs to"""
+    write_json_atomically(build_dir / JOB_FILE, job)
+
+
+def read_job(build_dir: Path) -> dict[str, Any] | None:
+    """Identity of the job build_dir belongs to, None if unknown"""
+    try:
+        return json.loads((build_dir / JOB_FILE).read_text())
+    except (OSError, ValueError) as exc:
+        logger.debug(f"Unknown job for build directory {build_dir}: {exc}")
+        return None
+
+
+def find_previous_build_dir(output_dir: Path, job: dict[str, Any]) -> Path | None:
+    """Most recent temporary build directory left in output_dir by a previous run of
+    the same job
+
+    Many jobs might share the same output directory, so build directories of other
+    jobs (or of unknown ones) are ignored
+    """
+    build_dirs = [
+        path
+        for path in output_dir.glob(".tmp*")
+        if path.is_dir() and (path / "collections").is_dir() and read_job(path) == job
+    ]
+    if not build_dirs:
+        return None
+    return max(build_dirs, key=lambda path: path.stat().st_mtime)
+
+
+def get_latest_crawl_state(build_dir: Path) -> Path | None:
+    """Latest crawl state YAML saved by the crawler in build_dir, if any"""
+    states = list(build_dir.glob("collections/*/crawls/*.yaml"))
+    if not states:
+        return None
+    return max(states, key=lambda path: path.stat().st_mtime)
+
+
+def mark_crawl_complete(build_dir: Path, returncode: int, *, partial: bool = False):
+    """Record that the crawl in build_dir completed, with an acceptable returncode,
+    and whether it stopped before crawling everything (e.g. disk budget exhausted)"""
+    write_json_atomically(
+        build_dir / CRAWL_COMPLETE_MARKER,
+        {"returncode": returncode, "partial": partial},
+    )
+
+
+def get_completed_crawl(build_dir: Path) -> tuple[int, bool] | None:
+    """Returncode of the completed crawl in build_dir and whether it is partial, None
+    if it did not complete"""
+    marker = build_dir / CRAWL_COMPLETE_MARKER
+    if not marker.exists():
+        return None
+    try:
+        content = json.loads(marker.read_text())
+        return int(content["returncode"]), bool(content.get("partial", False))
+    except (OSError, ValueError, KeyError) as exc:
+        logger.warning(f"Ignoring invalid crawl completion marker {marker}: {exc}")
+        return None
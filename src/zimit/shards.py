@@ -0,0 +1,185 @@
+"""
+Sharded crawl
+
+Run many crawler processes sharing one crawl queue, stored in a Redis server, each
+one writing its WARC files in its own working directory
+"""
+
+import socket
+import subprocess
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from zimit.constants import logger
+
+REDIS_START_TIMEOUT = 30
+# crawler servers listening on a port, which is shifted by shard number so that
+# shards running on the same host do not try to bind the same port
+SHARD_PORT_OPTIONS = ("--healthCheckPort", "--screencastPort")
+
+
+def get_free_port() -> int:
+    """A TCP port currently free on localhost"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class RedisServer:
+    """Local Redis server holding the crawl state shared by all crawler shards
+
+    State is kept in memory only, it is lost once the server is stopped
+    """
+
+    def __init__(self, directory: Path, port: int | None = None):
+        self.directory = directory
+        self.port = port or get_free_port()
+        self.process: subprocess.Popen | None = None
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.port}/0"
+
+    def start(self, timeout: float = REDIS_START_TIMEOUT):
+        """Start Redis server, returning once it accepts connections"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.process = subprocess.Popen(
+            [  # noqa: S607
+                "redis-server",
+                "--bind",
+                "127.0.0.1",
+                "--port",
+                str(self.port),
+                "--dir",
+                str(self.directory),
+                "--save",
+                "",
+                "--appendonly",
+                "no",
+            ],
+            stdout=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=1):
+                    return
+            except OSError:
+                if self.process.poll() is not None:
+                    raise RuntimeError(
+                        f"Redis server exited with {self.process.returncode}"
+                    ) from None
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(
+                        f"Redis server not ready after {timeout}s"
+                    ) from None
+                time.sleep(0.1)
+
+    def stop(self):
+        if not self.process:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+
+def get_shard_args(
+    crawler_args: list[str], shard: int, cwd: Path, redis_url: str
+) -> list[str]:
+    """Crawler command line of a shard, working in cwd with state stored at redis_url
+
+    Crawl statistics are computed from the shared state, so only the first shard
+    writes them to --statsFilename. Shard N listens on health check and screencast
+    ports + N, and only first shard exposes its browser (on fixed CDP port 9222)
+    with --debugAccessBrowser.
+    """
+    shard_args = []
+    args = iter(crawler_args)
+    for arg in args:
+        if arg == "--cwd":
+            next(args)
+            shard_args += ["--cwd", str(cwd)]
+        elif arg == "--statsFilename" and shard:
+            next(args)
+        elif arg == "--debugAccessBrowser" and shard:
+            continue
+        elif arg in SHARD_PORT_OPTIONS and shard:
+            # 0 means server is disabled
+            port = int(next(args))
+            shard_args += [arg, str(port + shard if port else 0)]
+        else:
+            shard_args.append(arg)
+    return [*shard_args, "--redisStoreUrl", redis_url]
+
+
+def get_shard_dirs(build_dir: Path, nb_shards: int) -> list[Path]:
+    """Working directory of each crawler shard, first one being build_dir itself"""
+    return [build_dir, *(build_dir / f"shard-{shard}" for shard in range(1, nb_shards))]
+
+
+def run_shards(
+    crawler_args: list[str],
+    cwds: list[Path],
+    redis_url: str,
+    on_start: Callable[[subprocess.Popen], None] | None = None,
+) -> int:
+    """Run one crawler per working directory in cwds, all sharing the same queue
+
+    on_start is called with each crawler process once started. Returns the first
+    non-zero exit code of shards, 0 if all succeeded
+    """
+    processes = []
+    try:
+        for shard, cwd in enumerate(cwds):
+            cwd.mkdir(parents=True, exist_ok=True)
+            logger.info(f"Starting crawler shard {shard} in {cwd}")
+            processes.append(
+                subprocess.Popen(get_shard_args(crawler_args, shard, cwd, redis_url))
+            )
+            if on_start:
+                on_start(processes[-1])
+        returncodes = [process.wait() for process in processes]
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+                process.wait()
+    for shard, returncode in enumerate(returncodes):
+        if returncode:
+            logger.error(f"Crawler shard {shard} returned {returncode}")
+            return returncode
+    return 0
+
+
+def run_sharded_crawl(
+    crawler_args: list[str],
+    build_dir: Path,
+    nb_shards: int,
+    redis_url: str | None,
+    on_start: Callable[[subprocess.Popen], None] | None = None,
+) -> int:
+    """Run a crawl split across nb_shards crawler processes
+
+    Shards share the crawl state stored at redis_url, or in a local Redis server
+    started for this crawl when not set. on_start is called with each crawler
+    process once started. Returns the exit code of the crawl.
+    """
+    redis = None
+    if not redis_url:
+        redis = RedisServer(build_dir / "redis")
+        redis.start()
+        redis_url = redis.url
+        logger.info(f"Started Redis server for crawler shards at {redis_url}")
+    try:
+        return run_shards(
+            crawler_args, get_shard_dirs(build_dir, nb_shards), redis_url, on_start
+        )
+    finally:
+        if redis:
+            redis.stop()
@@ -0,0 +1,102 @@
+"""
+Phases timing
+
+Measure resources used by each phase of a zimit run (seeds resolution, crawl,
+conversion, ...) and report them as JSON
+"""
+
+import datetime as dt
+import resource
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from zimit.__about__ import __version__
+from zimit.progress import write_json_atomically
+
+# resources whose usage accumulates over time, as opposed to peak RSS
+CUMULATIVE_KEYS = ("wall_time", "cpu_time", "bytes_read", "bytes_written")
+
+
+def _snapshot() -> dict[str, float]:
+    """Resources used so far by zimit and its (terminated) child processes"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "wall_time": time.monotonic(),
+        "cpu_time": own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss": max(own.ru_maxrss, children.ru_maxrss) * 1024,
+        # block I/O operations are counted in 512 bytes units
+        "bytes_read": (own.ru_inblock + children.ru_inblock) * 512,
+        "bytes_written": (own.ru_oublock + children.ru_oublock) * 512,
+    }
+
+
+class PhaseTimer:
+    """Measure wall time, CPU time, peak RSS and bytes read / written per phase
+
+    Phases are sequential, starting a phase ends the current one. CPU time and I/O
+    of child processes (crawler, warc2zim subprocess) are accounted once they have
+    terminated. Peak RSS is the largest RSS reached so far by zimit or one of its
+    child processes when the phase ends.
+    """
+
+    def __init__(self):
+        self.started_at = dt.datetime.now(tz=dt.UTC)
+        self.start = _snapshot()
+        self.phases: dict[str, dict[str, float]] = {}
+        self.current_phase: tuple[str, dict[str, float]] | None = None
+        self.report_path: Path | None = None
+        self.lock = threading.Lock()
+
+    def start_phase(self, phase: str):
+        self.stop()
+        with self.lock:
+            self.current_phase = (phase, _snapshot())
+
+    def stop(self):
+        """End current phase, if any"""
+        end = _snapshot()
+        with self.lock:
+            if not self.current_phase:
+                return
+            phase, start = self.current_phase
+            self.current_phase = None
+            usage = self.phases.setdefault(
+                phase, dict.fromkeys((*CUMULATIVE_KEYS, "peak_rss"), 0)
+            )
+            for key in CUMULATIVE_KEYS:
+                usage[key] += end[key] - start[key]
+            usage["peak_rss"] = max(usage["peak_rss"], end["peak_rss"])
+
+    def get_wall_times(self) -> dict[str, float]:
+        """Wall time spent in each phase so far, including current one"""
+        now = time.monotonic()
+        with self.lock:
+            wall_times = {
+                phase: usage["wall_time"] for phase, usage in self.phases.items()
+            }
+            if self.current_phase:
+                phase, start = self.current_phase
+                wall_times[phase] = wall_times.get(phase, 0) + now - start["wall_time"]
+        return wall_times
+
+    def get_report(self) -> dict[str, Any]:
+        end = _snapshot()
+        with self.lock:
+            phases = {phase: dict(usage) for phase, usage in self.phases.items()}
+        return {
+            "zimit_version": __version__,
+            "started_at": self.started_at.isoformat(),
+            "total": {key: end[key] - self.start[key] for key in CUMULATIVE_KEYS}
+            | {"peak_rss": end["peak_rss"]},
+            "phases": phases,
+        }
+
+    def write_report(self):
+        """Write timing report to report_path, if set"""
+        if not self.report_path:
+            return
+        write_json_atomically(self.report_path, self.get_report())
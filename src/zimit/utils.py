@@ -1,14 +1,506 @@
+import hashlib
+import io
+import queue
+import tarfile
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http import HTTPStatus
 from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
 
 import requests
+from requests.adapters import HTTPAdapter
 
-from zimit.constants import REQUESTS_TIMEOUT
+from zimit.constants import (
+    DOWNLOAD_BACKOFF_FACTOR,
+    DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_RETRIES,
+    PREFETCH_CHUNKS,
+    REQUESTS_TIMEOUT,
+    logger,
+)
+from zimit.metrics import Metrics
+from zimit.progress import RateMeter, write_json_atomically
 
 
-def download_file(url: str, fpath: Path):
-    """Download file from url to fpath with streaming"""
-    with requests.get(url, timeout=REQUESTS_TIMEOUT, stream=True) as resp:
+def get_session(pool_size: int = 1) -> requests.Session:
+    """A requests session whose connection pool is large enough for pool_size
+    concurrent downloads"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def download_file(
+    url: str,
+    fpath: Path,
+    session: requests.Session | None = None,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    *,
+    on_progress: Callable[[int, int | None], None] | None = None,
+    retries: int = DOWNLOAD_RETRIES,
+    verify_checksum: bool = False,
+    reuse_existing: bool = False,
+    cancel_event: threading.Event | None = None,
+):
+    """Download file from url to fpath with streaming
+
+    Data is first written to a `.part` file which is renamed to fpath only once
+    download is complete and verified (size announced by the server and, if
+    verify_checksum is set, SHA-256 from the `<url>.sha256` sidecar file). On network
+    errors, download is retried up to `retries` times with exponential backoff and
+    resumed with an HTTP Range request where it stopped.
+
+    If reuse_existing is set and fpath already exists (i.e. it has been completely
+    downloaded by a previous run), download is skipped when its size is still the
+    one announced by the server.
+
+    on_progress, if set, is called with number of bytes downloaded so far and total
+    number of bytes expected (if known) after every chunk. Download is aborted with
+    InterruptedError once cancel_event, if set, is set (checked after every chunk and
+    while waiting before a retry).
+    """
+    session = session or get_session()
+    if reuse_existing and fpath.exists():
+        size = fpath.stat().st_size
+        if _get_remote_size(url, session) in (None, size) and (
+            not verify_checksum or _get_expected_sha256(url, session) == sha256(fpath)
+        ):
+            logger.info(f"Reusing {fpath}, already downloaded from {url}")
+            if on_progress:
+                on_progress(size, size)
+            return
+        fpath.unlink()
+
+    part_path = fpath.with_name(f"{fpath.name}.part")
+    attempt = 0
+    while True:
+        try:
+            total = _download_part(
+                url,
+                part_path,
+                session,
+                chunk_size,
+                on_progress=on_progress,
+                cancel_event=cancel_event,
+            )
+            break
+        except requests.RequestException as exc:
+            if (
+                isinstance(exc, requests.HTTPError)
+                and exc.response is not None
+                and exc.response.status_code < HTTPStatus.INTERNAL_SERVER_ERROR
+            ):
+                raise
+            attempt += 1
+            if attempt > retries:
+                raise
+            delay = DOWNLOAD_BACKOFF_FACTOR * 2 ** (attempt - 1)
+            logger.warning(
+                f"Download of {url} failed ({exc}), retrying in {delay}s "
+                f"({attempt}/{retries})"
+            )
+            if not cancel_event:
+                time.sleep(delay)
+            elif cancel_event.wait(delay):
+                raise InterruptedError(f"Download of {url} cancelled") from exc
+
+    _get_validator_path(part_path).unlink(missing_ok=True)
+    size = part_path.stat().st_size
+    if total is not None and size != total:
+        part_path.unlink()
+        raise OSError(f"Downloaded {size} bytes from {url} instead of {total}")
+    if verify_checksum:
+        expected = _get_expected_sha256(url, session)
+        actual = sha256(part_path)
+        if actual != expected:
+            part_path.unlink()
+            raise OSError(
+                f"Checksum mismatch for {url}: expected {expected}, got {actual}"
+            )
+    part_path.rename(fpath)
+
+
+def _get_validator_path(part_path: Path) -> Path:
+    """File holding the validator (ETag or Last-Modified) of the file being
+    downloaded to part_path, so that a later run can safely resume it"""
+    return part_path.with_name(f"{part_path.name}.validator")
+
+
+def _download_part(
+    url: str,
+    part_path: Path,
+    session: requests.Session,
+    chunk_size: int,
+    *,
+    on_progress: Callable[[int, int | None], None] | None,
+    cancel_event: threading.Event | None = None,
+) -> int | None:
+    """Download (rest of) url to part_path, resuming where a previous attempt (of
+    this run or of a previous one) stopped
+
+    Download is only resumed when the validator of the file downloaded so far is
+    known, so that the server sends back the whole file should it have changed
+    since then. Returns the total size of the file (if known)
+    """
+    validator_path = _get_validator_path(part_path)
+    validator = validator_path.read_text() if validator_path.exists() else None
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    headers = {}
+    if offset and validator:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+    elif offset:
+        logger.warning(f"Cannot resume download of {url}, restarting from scratch")
+        offset = 0
+    with session.get(
+        url, headers=headers, timeout=REQUESTS_TIMEOUT, stream=True
+    ) as resp:
+        if resp.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+            total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+            if total.isdigit() and int(total) == offset:
+                # part file is already complete
+                return offset
+            # part file is invalid (larger than the file), fetch it all again
+            part_path.unlink()
+            validator_path.unlink(missing_ok=True)
+            return _download_part(
+                url,
+                part_path,
+                session,
+                chunk_size,
+                on_progress=on_progress,
+                cancel_event=cancel_event,
+            )
         resp.raise_for_status()
-        with open(fpath, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=8192):
+
+        if resp.status_code == HTTPStatus.PARTIAL_CONTENT:
+            total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+            total = int(total) if total.isdigit() else None
+            mode = "ab"
+        else:
+            total = (
+                int(resp.headers["Content-Length"])
+                if "Content-Length" in resp.headers
+                else None
+            )
+            offset = 0
+            mode = "wb"
+            # weak ETags cannot be used in If-Range
+            etag = resp.headers.get("ETag", "")
+            validator = (
+                etag if etag and not etag.startswith("W/") else None
+            ) or resp.headers.get("Last-Modified")
+            if validator:
+                validator_path.write_text(validator)
+            else:
+                validator_path.unlink(missing_ok=True)
+        if resp.headers.get("Content-Encoding", "identity") != "identity":
+            # size announced is the one of encoded content, not of what we write
+            total = None
+
+        done = offset
+        if on_progress:
+            on_progress(done, total)
+        with open(part_path, mode) as f:
+            for chunk in resp.iter_content(chunk_size=chunk_size):
+                if cancel_event and cancel_event.is_set():
+                    raise InterruptedError(f"Download of {url} cancelled")
                 f.write(chunk)
+                done += len(chunk)
+                if on_progress:
+                    on_progress(done, total)
+    return total
+
+
+def _get_remote_size(url: str, session: requests.Session) -> int | None:
+    """Size of file at url, as announced by the server, None if unknown
+
+    Some servers (e.g. pre-signed object store URLs) reject HEAD requests, size is
+    then probed with a GET request of the first byte only.
+    """
+    try:
+        resp = session.head(url, timeout=REQUESTS_TIMEOUT, allow_redirects=True)
+        resp.raise_for_status()
+        if "Content-Length" not in resp.headers:
+            return None
+        return int(resp.headers["Content-Length"])
+    except requests.RequestException as exc:
+        logger.debug(f"HEAD request of {url} failed ({exc}), probing with a GET")
+    try:
+        with session.get(
+            url, headers={"Range": "bytes=0-0"}, timeout=REQUESTS_TIMEOUT, stream=True
+        ) as resp:
+            resp.raise_for_status()
+            if resp.status_code == HTTPStatus.PARTIAL_CONTENT:
+                total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+                return int(total) if total.isdigit() else None
+            # range ignored, whole file announced (but not read)
+            if "Content-Length" not in resp.headers:
+                return None
+            return int(resp.headers["Content-Length"])
+    except requests.RequestException as exc:
+        logger.warning(f"Failed to get size of {url} ({exc}), considering it unknown")
+        return None
+
+
+def _get_expected_sha256(url: str, session: requests.Session) -> str:
+    """SHA-256 of file at url, retrieved from the `.sha256` sidecar file published
+    next to it (same URL with `.sha256` appended to its path, query being kept)"""
+    parts = urlsplit(url)
+    resp = session.get(
+        urlunsplit(parts._replace(path=f"{parts.path}.sha256")),
+        timeout=REQUESTS_TIMEOUT,
+    )
+    resp.raise_for_status()
+    # sidecar is in sha256sum format: `<hexdigest>  <filename>`
+    return resp.text.split()[0].lower()
+
+
+def sha256(fpath: Path) -> str:
+    """SHA-256 hexdigest of fpath content"""
+    with open(fpath, "rb") as fh:
+        return hashlib.file_digest(fh, "sha256").hexdigest()
+
+
+class DownloadProgress:
+    """Aggregate progress of concurrent downloads and write it as JSON to stats_path
+
+    File is rewritten at most once per interval (in seconds)
+    """
+
+    def __init__(
+        self,
+        stats_path: Path | None,
+        interval: float = 1,
+        metrics: Metrics | None = None,
+    ):
+        self.stats_path = stats_path
+        self.metrics = metrics
+        self.interval = interval
+        self.downloads: dict[str, dict[str, int | None]] = {}
+        self.last_write = 0.0
+        self.bytes = RateMeter()
+        self.lock = threading.Lock()
+
+    def update(self, url: str, done: int, total: int | None):
+        with self.lock:
+            self.downloads[url] = {"done": done, "total": total}
+            if time.monotonic() - self.last_write >= self.interval:
+                self.write()
+
+    def write(self):
+        done = sum(download["done"] or 0 for download in self.downloads.values())
+        total = sum(
+            download["total"] or download["done"] or 0
+            for download in self.downloads.values()
+        )
+        self.bytes.update(done, time.monotonic())
+        rate = self.bytes.rate
+        stats = {
+            "done": done,
+            "total": total,
+            "phase": "download",
+            "eta_seconds": round((total - done) / rate) if rate else None,
+            "rates": {"bytes_per_second": rate},
+            "downloads": self.downloads,
+        }
+        if self.metrics:
+            self.metrics.update(stats)
+        if self.stats_path:
+            write_json_atomically(self.stats_path, stats)
+        self.last_write = time.monotonic()
+
+
+class _PrefetchReader(io.RawIOBase):
+    """Read-only file object over a stream, read ahead by a background thread
+
+    Allows to overlap network reads with processing of the data (e.g. decompression).
+    Background thread stops once the reader is closed, even if it has not been read
+    until the end (e.g. on error while processing the data). Reading fails with
+    InterruptedError once cancel_event, if set, is set.
+    """
+
+    def __init__(
+        self,
+        stream,
+        chunk_size: int,
+        on_read: Callable[[int], None] | None = None,
+        cancel_event: threading.Event | None = None,
+    ):
+        self.chunks: queue.Queue[bytes | BaseException] = queue.Queue(
+            maxsize=PREFETCH_CHUNKS
+        )
+        self.buffer = b""
+        self.eof = False
+        self.stop_event = threading.Event()
+        self.cancel_event = cancel_event
+        self.thread = threading.Thread(
+            target=self._prefetch, args=(stream, chunk_size, on_read), daemon=True
+        )
+        self.thread.start()
+
+    def _put(self, item: bytes | BaseException) -> bool:
+        """Queue item for the reader, False if reader has been closed meanwhile"""
+        while not self.stop_event.is_set():
+            try:
+                self.chunks.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _prefetch(self, stream, chunk_size: int, on_read: Callable[[int], None] | None):
+        try:
+            done = 0
+            while chunk := stream.read(chunk_size):
+                if self.cancel_event and self.cancel_event.is_set():
+                    raise InterruptedError("Stream reading cancelled")
+                done += len(chunk)
+                if on_read:
+                    on_read(done)
+                if not self._put(chunk):
+                    return
+            self._put(b"")
+        except BaseException as exc:
+            self._put(exc)
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self.stop_event.set()
+        super().close()
+
+    def readinto(self, buffer) -> int:
+        if not self.buffer and not self.eof:
+            chunk = self.chunks.get()
+            if isinstance(chunk, BaseException):
+                raise chunk
+            self.buffer = chunk
+            self.eof = not chunk
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+def stream_extract_tar(
+    url: str,
+    extract_path: Path,
+    session: requests.Session | None = None,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    *,
+    on_progress: Callable[[int, int | None], None] | None = None,
+    cancel_event: threading.Event | None = None,
+):
+    """Extract tar (possibly compressed) at url to extract_path while downloading it
+
+    Archive is never written to disk and network reads are overlapped with
+    decompression / extraction, but download cannot be resumed should it fail.
+    Extraction is aborted with InterruptedError once cancel_event, if set, is set.
+    """
+    with (session or get_session()).get(
+        url, timeout=REQUESTS_TIMEOUT, stream=True
+    ) as resp:
+        resp.raise_for_status()
+        total = (
+            int(resp.headers["Content-Length"])
+            if "Content-Length" in resp.headers
+            and resp.headers.get("Content-Encoding", "identity") == "identity"
+            else None
+        )
+        resp.raw.decode_content = True
+        if on_progress:
+            on_progress(0, total)
+        with (
+            _PrefetchReader(
+                resp.raw,
+                chunk_size,
+                on_read=(
+                    (lambda done: on_progress(done, total)) if on_progress else None
+                ),
+                cancel_event=cancel_event,
+            ) as reader,
+            tarfile.open(fileobj=reader, mode="r|*", bufsize=chunk_size) as fh,
+        ):
+            fh.extractall(path=extract_path, filter="data")
+
+
+def download_files(
+    downloads: dict[str, Path],
+    concurrency: int,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    progress: DownloadProgress | None = None,
+    *,
+    stream_extracts: dict[str, Path] | None = None,
+    verify_checksum: bool = False,
+    reuse_existing: bool = False,
+):
+    """Download many files concurrently, sharing a pool of connections
+
+    downloads maps URL to download to the path where it has to be saved ;
+    stream_extracts maps URL of tar archives to the directory where they have to be
+    extracted while being downloaded (see stream_extract_tar)
+    """
+
+    def _on_progress(url: str):
+        if not progress:
+            return None
+        return lambda done, total: progress.update(url, done, total)
+
+    def _stream_extract(url: str, extract_path: Path):
+        logger.info(f"Extracting {url} to {extract_path} while downloading it")
+        stream_extract_tar(
+            url,
+            extract_path,
+            session=session,
+            chunk_size=chunk_size,
+            on_progress=_on_progress(url),
+            cancel_event=cancel_event,
+        )
+        logger.info(f"Extracted {url}")
+
+    def _download(url: str, fpath: Path):
+        logger.info(f"Downloading {url} to {fpath}")
+        download_file(
+            url,
+            fpath,
+            session=session,
+            chunk_size=chunk_size,
+            on_progress=_on_progress(url),
+            verify_checksum=verify_checksum,
+            reuse_existing=reuse_existing,
+            cancel_event=cancel_event,
+        )
+        logger.info(f"Downloaded {url}")
+
+    # set on first error, so that other transfers are aborted
+    cancel_event = threading.Event()
+
+    with (
+        get_session(pool_size=concurrency) as session,
+        ThreadPoolExecutor(max_workers=concurrency) as executor,
+    ):
+        futures = [
+            executor.submit(_download, url, fpath) for url, fpath in downloads.items()
+        ] + [
+            executor.submit(_stream_extract, url, extract_path)
+            for url, extract_path in (stream_extracts or {}).items()
+        ]
+        try:
+            # raise the first error encountered, if any
+            for future in as_completed(futures):
+                future.result()
+        except BaseException:
+            # do not start pending downloads, and abort running ones
+            cancel_event.set()
+            executor.shutdown(cancel_futures=True)
+            raise
+    if progress:
+        with progress.lock:
+            progress.write()
@@ -0,0 +1,479 @@
+"""
+WARC files handling
+
+Helpers to decode and index WARC files produced by the crawler (or passed through
+--warcs) before they are handed over to warc2zim
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+from collections.abc import Iterable
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from pathlib import Path
+
+import inotify
+import inotify.adapters
+from warcio.archiveiterator import ArchiveIterator
+from warcio.warcwriter import WARCWriter
+
+from zimit.constants import logger
+
+WARC_SUFFIXES = (".warc", ".warc.gz")
+# parts of mimetypes of content rewritten by warc2zim relative to its own URL (links
+# of HTML and CSS, URLs of JS and JSON), which cannot be shared across URLs
+REWRITTEN_MIMETYPES = ("html", "css", "javascript", "ecmascript", "json")
+
+# external gzip decompressors, by order of preference, with arguments to decompress
+# to stdout ; inflating a gzip stream is sequential, igzip inflates faster (SIMD) and
+# pigz only moves reading, writing and CRC checks to other threads, but both run in
+# their own process, concurrently with tar extraction done by zimit
+GZIP_DECOMPRESSORS = {
+    "igzip": ["-d", "-c"],
+    "pigz": ["-d", "-c"],
+}
+
+
+def is_warc_file(path: Path) -> bool:
+    """Whether path looks like a WARC file (based on its name only)"""
+    return path.name.endswith(WARC_SUFFIXES)
+
+
+def iter_warc_files(locations: Iterable[Path]):
+    """Yield WARC files found at locations (files or directories), by name order"""
+    for location in locations:
+        if location.is_dir():
+            yield from sorted(
+                (path for path in location.rglob("*") if is_warc_file(path)),
+                key=lambda path: path.name,
+            )
+        elif is_warc_file(location):
+            yield location
+
+
+def extract_tar_warcs(tar_path: Path, extract_path: Path) -> int:
+    """Extract WARC files from an uncompressed tar archive to extract_path
+
+    Only members which are WARC files are extracted. Their data is copied straight
+    from its offset in the archive with copy_file_range, i.e. inside the kernel (and
+    without copying data blocks at all on filesystems supporting it), instead of
+    being read and written back by Python.
+
+    Returns the number of WARC files extracted.
+    """
+    nb_warcs = 0
+    with (
+        tarfile.open(tar_path, "r:") as tar,
+        open(tar_path, "rb") as src,
+    ):
+        for member in tar:
+            if not member.isfile() or not member.name.endswith(WARC_SUFFIXES):
+                continue
+            # same safety checks as when extracting with the `data` filter
+            member = tarfile.data_filter(member, str(extract_path))  # noqa: PLW2901
+            target = extract_path / member.name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with open(target, "wb") as dst:
+                _copy_range(src, dst, member.offset_data, member.size)
+            nb_warcs += 1
+    return nb_warcs
+
+
+def get_gzip_decompressor() -> list[str] | None:
+    """Command line of the best external gzip decompressor available, if any"""
+    for name, args in GZIP_DECOMPRESSORS.items():
+        if path := shutil.which(name):
+            return [path, *args]
+    return None
+
+
+def extract_tar_gz(
+    tar_path: Path, extract_path: Path, decompressor: list[str] | None = None
+):
+    """Extract a tar.gz archive to extract_path
+
+    Decompression is done by an external gzip decompressor if one is available (see
+    GZIP_DECOMPRESSORS), in parallel with extraction, its output being streamed to
+    tarfile. Falls back to Python's gzip should none be available or should it fail.
+    """
+    decompressor = decompressor or get_gzip_decompressor()
+    if decompressor:
+        try:
+            with subprocess.Popen(
+                [*decompressor, str(tar_path)],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            ) as proc:
+                with tarfile.open(fileobj=proc.stdout, mode="r|") as tar:
+                    tar.extractall(path=extract_path, filter="data")
+                # also drains what remains after end-of-archive marker
+                _, stderr = proc.communicate()
+                if proc.returncode != 0:
+                    raise OSError(
+                        f"{decompressor[0]} failed with code {proc.returncode}: "
+                        f"{stderr.decode(errors='replace').strip()}"
+                    )
+            return
+        except (OSError, tarfile.TarError) as exc:
+            logger.warning(
+                f"Failed to extract {tar_path} with {decompressor[0]} ({exc}), "
+                "falling back to Python gzip decompression"
+            )
+            shutil.rmtree(extract_path, ignore_errors=True)
+            extract_path.mkdir(parents=True)
+    with tarfile.open(tar_path, "r:*") as tar:
+        tar.extractall(path=extract_path, filter="data")
+
+
+def _copy_range(src, dst, offset: int, size: int):
+    """Copy size bytes of src starting at offset to dst"""
+    copied = 0
+    try:
+        while copied < size:
+            nb_bytes = os.copy_file_range(
+                src.fileno(),
+                dst.fileno(),
+                size - copied,
+                offset + copied,
+            )
+            if not nb_bytes:
+                raise OSError(f"Unexpected end of {src.name}")
+            copied += nb_bytes
+    except OSError:
+        if copied:
+            raise
+        # copy_file_range not supported (old kernel, different filesystems, ...)
+        src.seek(offset)
+        dst.seek(0)
+        remaining = size
+        while remaining:
+            chunk = src.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                raise OSError(f"Unexpected end of {src.name}") from None
+            dst.write(chunk)
+            remaining -= len(chunk)
+
+
+def get_index_path(index_dir: Path, warc_file: Path) -> Path:
+    """Path of the JSONL index of a given WARC file"""
+    # WARC files from different inputs might have the same name
+    path_digest = hashlib.sha256(str(warc_file.resolve()).encode()).hexdigest()[:8]
+    return index_dir / f"{warc_file.name}-{path_digest}.idx.jsonl"
+
+
+def is_index_up_to_date(warc_file: Path, index_file: Path) -> bool:
+    """Whether index_file exists and has been created after last WARC modification"""
+    return (
+        index_file.exists() and index_file.stat().st_mtime >= warc_file.stat().st_mtime
+    )
+
+
+def index_warc(warc_file: Path, index_file: Path) -> int:
+    """Decode all records of a WARC file and write its JSONL index
+
+    Each line of the index holds the record type, target URI, offset and length in
+    the WARC file, payload digest and length, HTTP status and Content-Type,
+    refers-to target URI (for revisit records) and date.
+
+    Returns the number of records found.
+    """
+    nb_records = 0
+    tmp_index_file = index_file.with_suffix(".tmp")
+    with open(warc_file, "rb") as ifh, open(tmp_index_file, "w") as ofh:
+        records = ArchiveIterator(ifh)
+        for record in records:
+            # read the whole payload so that a corrupted / truncated WARC is detected
+            # now and not later in the conversion
+            stream = record.content_stream()
+            payload_length = 0
+            while chunk := stream.read(1024 * 1024):
+                payload_length += len(chunk)
+            ofh.write(
+                json.dumps(
+                    {
+                        "type": record.rec_type,
+                        "uri": record.rec_headers.get_header("WARC-Target-URI"),
+                        "offset": records.get_record_offset(),
+                        "length": records.get_record_length(),
+                        "digest": record.rec_headers.get_header("WARC-Payload-Digest"),
+                        "payload_length": payload_length,
+                        "status": (
+                            record.http_headers.get_statuscode()
+                            if record.rec_type == "response" and record.http_headers
+                            else None
+                        ),
+                        "mimetype": (
+                            record.http_headers.get_header("Content-Type")
+                            if record.rec_type == "response" and record.http_headers
+                            else None
+                        ),
+                        "refers_to": record.rec_headers.get_header(
+                            "WARC-Refers-To-Target-URI"
+                        ),
+                        "date": record.rec_headers.get_header("WARC-Date"),
+                    }
+                )
+                + "\n"
+            )
+            nb_records += 1
+    tmp_index_file.rename(index_file)
+    return nb_records
+
+
+def _index_warc_if_needed(warc_file: Path, index_dir: Path) -> int:
+    index_file = get_index_path(index_dir, warc_file)
+    if is_index_up_to_date(warc_file, index_file):
+        with open(index_file) as fh:
+            return sum(1 for _ in fh)
+    return index_warc(warc_file, index_file)
+
+
+def index_warcs(
+    warc_files: list[Path], index_dir: Path, max_workers: int | None = None
+) -> dict[Path, int]:
+    """Index many WARC files in parallel, in a pool of processes (one per CPU by
+    default)
+
+    WARC files whose index is already up-to-date are not indexed again.
+
+    Returns the number of records per WARC file ; raises if a WARC file is
+    unreadable
+    """
+    if not warc_files:
+        return {}
+    index_dir.mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor(
+        max_workers=min(len(warc_files), max_workers or os.cpu_count() or 1)
+    ) as executor:
+        return dict(
+            zip(
+                warc_files,
+                executor.map(
+                    _index_warc_if_needed,
+                    warc_files,
+                    repeat(index_dir, len(warc_files)),
+                ),
+                strict=True,
+            )
+        )
+
+
+def iter_index(index_dir: Path, warc_file: Path):
+    """Yield entries of the index of a WARC file"""
+    with open(get_index_path(index_dir, warc_file)) as fh:
+        for line in fh:
+            yield json.loads(line)
+
+
+def get_indexed_uris(warc_files: Iterable[Path], index_dir: Path) -> set[str]:
+    """Target URIs of all records of (indexed) warc_files"""
+    return {
+        entry["uri"]
+        for warc_file in warc_files
+        for entry in iter_index(index_dir, warc_file)
+        if entry["uri"]
+    }
+
+
+def get_earliest_date(warc_files: Iterable[Path], index_dir: Path) -> str | None:
+    """Earliest WARC-Date of response records of (indexed) warc_files"""
+    return min(
+        (
+            entry["date"]
+            for warc_file in warc_files
+            for entry in iter_index(index_dir, warc_file)
+            if entry["type"] == "response" and entry.get("date")
+        ),
+        default=None,
+    )
+
+
+def filter_warc(
+    warc_file: Path, index_dir: Path, exclude_uris: set[str], output_file: Path
+) -> int:
+    """Copy records of (indexed) warc_file whose target URI is not in exclude_uris
+
+    Records are copied as is (still compressed for a .warc.gz) from their offset in
+    warc_file, without being decoded again. Records without target URI (warcinfo)
+    and revisit records referring to an excluded URI are not copied.
+
+    Returns the number of records copied.
+    """
+    nb_records = 0
+    with open(warc_file, "rb") as src, open(output_file, "wb") as dst:
+        for entry in iter_index(index_dir, warc_file):
+            if (
+                not entry["uri"]
+                or entry["uri"] in exclude_uris
+                or entry["refers_to"] in exclude_uris
+            ):
+                continue
+            src.seek(entry["offset"])
+            dst.write(src.read(entry["length"]))
+            nb_records += 1
+    return nb_records
+
+
+def dedup_warcs(
+    warc_files: list[Path], index_dir: Path, output_dir: Path
+) -> tuple[list[Path], int]:
+    """Replace response records of (indexed) warc_files whose payload is identical to
+    the one of a previous response record by revisit records referring to it
+
+    Payloads are compared on their WARC-Payload-Digest and Content-Type, the first
+    record of each payload (in warc_files order) being kept. Only 200 responses with
+    a non-empty payload are considered: redirects and other empty responses all
+    share the same digest while their HTTP headers differ. Content rewritten by
+    warc2zim relative to its URL (see REWRITTEN_MIMETYPES) is never deduplicated,
+    since a revisit is served with the content of the original URL. WARC files
+    holding duplicates are rewritten in output_dir, other ones are kept as is.
+
+    Returns WARC files to convert (in the same order) and number of duplicates.
+    """
+    originals: dict[tuple[str, str], dict[str, str]] = {}
+    dedup_files = []
+    nb_duplicates = 0
+    for index, warc_file in enumerate(warc_files):
+        duplicates: dict[int, dict[str, str]] = {}
+        for entry in iter_index(index_dir, warc_file):
+            # indexes written by previous versions have no status nor mimetype
+            mimetype = (entry.get("mimetype") or "").lower()
+            if (
+                entry["type"] != "response"
+                or not entry["uri"]
+                or not entry["digest"]
+                or entry.get("status") != "200"
+                or not entry.get("payload_length")
+                or not mimetype
+                or any(part in mimetype for part in REWRITTEN_MIMETYPES)
+            ):
+                continue
+            key = (entry["digest"], mimetype)
+            if original := originals.get(key):
+                duplicates[entry["offset"]] = original
+            else:
+                originals[key] = {
+                    "uri": entry["uri"],
+                    "date": entry["date"],
+                }
+        if not duplicates:
+            dedup_files.append(warc_file)
+            continue
+        output_file = output_dir / f"{index:05}-{warc_file.name}"
+        _write_deduplicated_warc(warc_file, index_dir, duplicates, output_file)
+        dedup_files.append(output_file)
+        nb_duplicates += len(duplicates)
+    return dedup_files, nb_duplicates
+
+
+def _write_deduplicated_warc(
+    warc_file: Path,
+    index_dir: Path,
+    duplicates: dict[int, dict[str, str]],
+    output_file: Path,
+):
+    """Copy warc_file records as is, except duplicates (by offset) which are written
+    as revisit records of their original record"""
+    with open(warc_file, "rb") as src, open(output_file, "wb") as dst:
+        writer = WARCWriter(dst, gzip=warc_file.name.endswith(".gz"))
+        for entry in iter_index(index_dir, warc_file):
+            src.seek(entry["offset"])
+            original = duplicates.get(entry["offset"])
+            if not original:
+                dst.write(src.read(entry["length"]))
+                continue
+            if original["uri"] == entry["uri"]:
+                # same URL with the same payload, already converted from original
+                continue
+            record = next(iter(ArchiveIterator(src)))
+            writer.write_record(
+                writer.create_revisit_record(
+                    entry["uri"],
+                    entry["digest"],
+                    original["uri"],
+                    original["date"],
+                    http_headers=record.http_headers,
+                    warc_headers_dict={"WARC-Date": entry["date"]},
+                )
+            )
+
+
+class WarcIndexer:
+    """Index WARC files in the background, each file being indexed only once"""
+
+    def __init__(self, index_dir: Path):
+        self.index_dir = index_dir
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.futures: dict[Path, Future] = {}
+        self.lock = threading.Lock()
+
+    def submit(self, warc_file: Path):
+        with self.lock:
+            if warc_file in self.futures:
+                return
+            logger.debug(f"Indexing {warc_file}")
+            self.futures[warc_file] = self.executor.submit(
+                index_warc, warc_file, get_index_path(self.index_dir, warc_file)
+            )
+
+    def wait(self) -> dict[Path, int]:
+        """Wait for all submitted indexes
+
+        Returns the number of records per WARC file ; raises if a WARC file is
+        unreadable
+        """
+        with self.lock:
+            futures = dict(self.futures)
+        results = {warc_file: future.result() for warc_file, future in futures.items()}
+        self.executor.shutdown()
+        return results
+
+
+class ClosedWarcWatcher:
+    """Watch crawler collections (of all crawler shards) for WARC files which are
+    closed (rolled over)
+
+    Each closed WARC file is handed to the indexer while the crawl is still running
+    """
+
+    def __init__(self, collections_dirs: Iterable[Path], indexer: WarcIndexer):
+        self.collections_dirs = list(collections_dirs)
+        self.indexer = indexer
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def watch(self):
+        # collections directories must exist for inotify to watch them
+        for collections_dir in self.collections_dirs:
+            collections_dir.mkdir(parents=True, exist_ok=True)
+        self.thread = threading.Thread(target=self.inotify_watcher, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.thread:
+            return
+        self.stop_event.set()
+        self.thread.join()
+
+    def inotify_watcher(self):
+        ino = inotify.adapters.InotifyTrees(
+            [str(collections_dir) for collections_dir in self.collections_dirs],
+            mask=inotify.constants.IN_CLOSE_WRITE,  # pyright: ignore
+        )
+        for event in ino.event_gen(yield_nones=True):
+            if self.stop_event.is_set():
+                return
+            if event is None:
+                continue
+            _, type_names, path, filename = event
+            if "IN_CLOSE_WRITE" not in type_names:
+                continue
+            fpath = Path(path) / filename
+            if fpath.parent.name == "archive" and is_warc_file(fpath):
+                self.indexer.submit(fpath)
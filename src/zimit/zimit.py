@@ -5,107 +5,56 @@ and then calls the Node based driver
 """
 
 import atexit
+import hashlib
 import json
+import os
 import re
 import shutil
 import signal
 import subprocess
 import sys
-import tarfile
 import tempfile
 import urllib.parse
-from argparse import ArgumentParser
-from multiprocessing import Process
+from argparse import ArgumentParser, ArgumentTypeError
 from pathlib import Path
 
-import inotify
-import inotify.adapters
-from warc2zim.main import main as warc2zim
-from zimscraperlib.uri import rebuild_uri
-
 from zimit.__about__ import __version__
+from zimit.autoscale import WorkersAutoscaler, run_adaptive_crawl
+from zimit.checkpoint import ConversionManifest
+from zimit.cleanup import delete_in_background, delete_tree, rename_aside
 from zimit.constants import (
+    DEFAULT_DOWNLOAD_CONCURRENCY,
+    DOWNLOAD_CHUNK_SIZE,
+    EXIT_CODE_CRAWLER_INTERRUPTED,
     EXIT_CODE_CRAWLER_SIZE_LIMIT_HIT,
     EXIT_CODE_CRAWLER_TIME_LIMIT_HIT,
     EXIT_CODE_WARC2ZIM_CHECK_FAILED,
     NORMAL_WARC2ZIM_EXIT_CODE,
     logger,
 )
-from zimit.utils import download_file
+from zimit.conversion import (
+    check_warc2zim_args,
+    get_default_cache_dir,
+    get_zim_name,
+    get_zim_path,
+    run_warc2zim_process,
+)
+from zimit.diskguard import CrawlerProcesses, DiskGuard, delete_artifacts
+from zimit.progress import ProgressFileWatcher, write_json_atomically
+from zimit.resume import (
+    find_previous_build_dir,
+    get_completed_crawl,
+    get_latest_crawl_state,
+    mark_crawl_complete,
+    write_job,
+)
+from zimit.shards import get_shard_dirs, run_sharded_crawl
+from zimit.timings import PhaseTimer
 
 temp_root_dir: Path | None = None
-
-
-class ProgressFileWatcher:
-    def __init__(
-        self, crawl_stats_path: Path, warc2zim_stats_path, zimit_stats_path: Path
-    ):
-        self.crawl_stats_path = crawl_stats_path
-        self.warc2zim_stats_path = warc2zim_stats_path
-        self.zimit_stats_path = zimit_stats_path
-
-        # touch them all so inotify is not unhappy on add_watch
-        self.crawl_stats_path.touch()
-        self.warc2zim_stats_path.touch()
-        self.process = None
-
-    def stop(self):
-        if not self.process:
-            return
-        self.process.join(0.1)
-        self.process.terminate()
-
-    def watch(self):
-        self.process = Process(
-            target=self.inotify_watcher,
-            args=(
-                str(self.crawl_stats_path),
-                str(self.warc2zim_stats_path),
-                str(self.zimit_stats_path),
-            ),
-        )
-        self.process.daemon = True
-        self.process.start()
-
-    def inotify_watcher(self, crawl_fpath: str, warc2zim_fpath: str, zimit_fpath: str):
-        ino = inotify.adapters.Inotify()
-        ino.add_watch(crawl_fpath, inotify.constants.IN_MODIFY)  # pyright: ignore
-        ino.add_watch(warc2zim_fpath, inotify.constants.IN_MODIFY)  # pyright: ignore
-
-        def crawl_conv(data):
-            # we consider crawl to be 90% of the workload so total = craw_total * 90%
-            return {
-                "done": data["crawled"],
-                "total": int(data["total"] / 0.9),
-            }
-
-        def warc2zim_conv(data):
-            # we consider warc2zim to be 10% of the workload so
-            # warc2zim_total = 10% and  total = 90 + warc2zim_total * 10%
-            return {
-                "done": int(
-                    data["total"]
-                    * (0.9 + (float(data["written"]) / data["total"]) / 10)
-                ),
-                "total": data["total"],
-            }
-
-        for _, _, fpath, _ in ino.event_gen(yield_nones=False):  # pyright: ignore
-            func = {crawl_fpath: crawl_conv, warc2zim_fpath: warc2zim_conv}.get(fpath)
-            if not func:
-                continue
-            # open input and output separatly as to not clear output on error
-            with open(fpath) as ifh:
-                try:
-                    out = func(json.load(ifh))
-                except Exception:  # nosec # noqa: S112
-                    # simply ignore progress update should an error arise
-                    # might be malformed input for instance
-                    continue
-                if not out:
-                    continue
-                with open(zimit_fpath, "w") as ofh:
-                    json.dump(out, ofh)
+background_cleanup = False
+# whether cleanup() is registered to run at exit
+cleanup_pending = False
 
 
 def cleanup():
@@ -115,18 +64,60 @@ def cleanup():
     logger.info("")
     logger.info("----------")
     logger.info(f"Cleanup, removing temp dir: {temp_root_dir}")
-    shutil.rmtree(temp_root_dir)
+    # renamed first so that temp dir is gone at once, even if deletion is interrupted
+    try:
+        deleting_dir = rename_aside(temp_root_dir)
+    except OSError as exc:
+        logger.warning(f"Failed to rename temp dir aside, deleting it in place: {exc}")
+        deleting_dir = temp_root_dir
+    if background_cleanup:
+        logger.info(f"Deleting {deleting_dir} in the background")
+        delete_in_background(deleting_dir)
+    else:
+        delete_tree(deleting_dir)
+
+
+def register_cleanup():
+    global cleanup_pending  # noqa: PLW0603
+    cleanup_pending = True
+    atexit.register(cleanup)
 
 
 def cancel_cleanup():
+    global cleanup_pending  # noqa: PLW0603
     logger.info(
         f"Temporary files have been kept in {temp_root_dir}, please clean them"
         " up manually once you don't need them anymore"
     )
+    cleanup_pending = False
     atexit.unregister(cleanup)
 
 
-def run(raw_args):
+def run(raw_args, timer: PhaseTimer | None = None, *, cleanup_at_exit: bool = True):
+    """Run zimit with raw_args
+
+    Temporary files are deleted when the interpreter exits, or as soon as the run is
+    over if cleanup_at_exit is not set (e.g. in a process running many jobs)
+    """
+    global cleanup_pending  # noqa: PLW0603
+    timer = timer or PhaseTimer()
+    try:
+        return _run(raw_args, timer)
+    finally:
+        timer.stop()
+        if timer.report_path:
+            try:
+                timer.write_report()
+                logger.info(f"Phases timing report written to {timer.report_path}")
+            except OSError as exc:
+                logger.warning(f"Failed to write phases timing report: {exc}")
+        if cleanup_pending and not cleanup_at_exit:
+            cleanup_pending = False
+            atexit.unregister(cleanup)
+            cleanup()
+
+
+def _run(raw_args, timer: PhaseTimer):
     parser = ArgumentParser(
         description="Run a browser-based crawl on the specified URL and convert to ZIM"
     )
@@ -443,6 +434,14 @@ def run(raw_args):
         "Relative filename resolves to output directory, see --output.",
     )
 
+    parser.add_argument(
+        "--zimit-progress-interval",
+        help="Minimum interval (in seconds) between two updates of "
+        "--zimit-progress-file. Defaults to 1",
+        type=float,
+        default=1,
+    )
+
     parser.add_argument(
         "--warc2zim-progress-file",
         help="If set, output warc2zim stats as JSON to this file. Relative filename "
@@ -730,6 +729,17 @@ def run(raw_args):
         help="Build directory for WARC files (if not set, output directory is used)",
     )
 
+    parser.add_argument(
+        "--resume",
+        help="Resume previous run interrupted or failed in the same --build (or "
+        "latest temporary build directory of --output left by a run with the same "
+        "seeds and ZIM name): WARC files already created "
+        "are reused and the crawl restarts from its latest saved state (see "
+        "--saveState, which defaults to 'always' with this flag), or is skipped if it "
+        "had completed. Temporary files are kept until the ZIM has been created.",
+        action="store_true",
+    )
+
     parser.add_argument("--adminEmail", help="Admin Email for Zimit crawler")
 
     parser.add_argument(
@@ -771,17 +781,249 @@ def run(raw_args):
         "path/URLs separated by comma",
     )
 
+    parser.add_argument(
+        "--warcs-download-concurrency",
+        help="Number of --warcs HTTP(S) URLs downloaded in parallel. Default is "
+        f"{DEFAULT_DOWNLOAD_CONCURRENCY}.",
+        type=int,
+        default=DEFAULT_DOWNLOAD_CONCURRENCY,
+    )
+
+    parser.add_argument(
+        "--warcs-download-chunk-size",
+        help="Size (in bytes) of chunks read from the network while downloading "
+        f"--warcs HTTP(S) URLs. Default is {DOWNLOAD_CHUNK_SIZE}.",
+        type=int,
+        default=DOWNLOAD_CHUNK_SIZE,
+    )
+
+    parser.add_argument(
+        "--warcs-stream-extract",
+        help="If set, --warcs HTTP(S) URLs to tar / tar.gz archives are extracted "
+        "while being downloaded, without storing the archive on disk. Such downloads "
+        "cannot be resumed nor verified with --warcs-verify-checksum.",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--warcs-verify-checksum",
+        help="If set, verify SHA-256 of every --warcs HTTP(S) URL downloaded against "
+        "the `<URL>.sha256` file published next to it.",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--index-warcs-during-crawl",
+        help="If set, WARC files closed by the crawler (see --rolloverSize) are "
+        "decoded and indexed in the background while the crawl is still running, "
+        "so that --baseline-warcs and --dedup-payloads only have to index the last "
+        "ones once the crawl is over. Conversion itself still starts after the "
+        "crawl.",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--baseline-warcs",
+        help="Comma-separated list of local WARC files or directories of a previous "
+        "crawl of the same site, used as baseline: records of URLs which are not "
+        "crawled again are merged into the ZIM. With --useSitemap and no "
+        "--sitemapFromDate, only sitemap URLs modified since the baseline crawl are "
+        "added to the crawl, but links found in crawled pages are still followed, "
+        "so unchanged pages reached from seeds are crawled again (see "
+        "--baseline-sitemap-only).",
+    )
+
+    parser.add_argument(
+        "--baseline-sitemap-only",
+        help="If set with --baseline-warcs and --useSitemap, links found in pages "
+        "are not followed (crawler --depth 0): only seeds and sitemap URLs "
+        "(modified since the baseline crawl) are crawled, other pages being taken "
+        "from the baseline.",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--dedup-payloads",
+        help="If set, identical payloads (same WARC payload digest) found in many "
+        "WARC files or crawls are converted only once: other URLs with the same "
+        "payload are handed to warc2zim as revisit records of the first one. "
+        "HTML, CSS, JS and JSON, which warc2zim rewrites per URL, are not "
+        "deduplicated.",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--crawler-shards",
+        help="Number of crawler processes sharing the crawl queue (each one with "
+        "--workers browsers), for very large crawls. Their WARC files are all "
+        "converted into one ZIM. Page and size limits apply to each shard. "
+        "Default is 1.",
+        type=int,
+        default=1,
+    )
+
+    parser.add_argument(
+        "--crawler-redis-url",
+        help="URL of the Redis server storing the crawl queue shared by "
+        "--crawler-shards, so that crawlers running on other nodes (with the same "
+        "--crawlId) can take part in the crawl. Default is to start a local Redis "
+        "server for the crawl.",
+    )
+
+    parser.add_argument(
+        "--adaptive-workers",
+        help="If set, adjust the number of crawler workers during the crawl, between "
+        "--min-workers and --max-workers, based on host CPU load, available memory, "
+        "memory used by browsers and time spent per page. The crawler is restarted "
+        "from its saved state to apply a new number of workers. The crawl starts "
+        "with --workers workers.",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--min-workers",
+        help="Minimum number of crawler workers with --adaptive-workers. Default is 1.",
+        type=int,
+        default=1,
+    )
+
+    parser.add_argument(
+        "--max-workers",
+        help="Maximum number of crawler workers with --adaptive-workers. Default is "
+        "the number of CPUs.",
+        type=int,
+        default=os.cpu_count() or 1,
+    )
+
+    parser.add_argument(
+        "--adaptive-workers-interval",
+        help="Seconds between two checks of the number of crawler workers with "
+        "--adaptive-workers. Default is 300.",
+        type=float,
+        default=300,
+    )
+
+    parser.add_argument(
+        "--disk-budget",
+        help="Maximum disk space (in bytes) the build directory may use during the "
+        "crawl. Once reached, the crawl is gracefully stopped and what has been "
+        "crawled is converted (partialZim is set in progress file). Intermediate "
+        "files are also deleted as soon as they are not needed anymore.",
+        type=int,
+    )
+
+    parser.add_argument(
+        "--disk-reserve",
+        help="Disk space (in bytes) to keep free on the build directory volume "
+        "during the crawl. Once reached, the crawl is gracefully stopped and what "
+        "has been crawled is converted (partialZim is set in progress file). "
+        "Intermediate files are also deleted as soon as they are not needed anymore.",
+        type=int,
+    )
+
+    parser.add_argument(
+        "--background-cleanup",
+        help="If set, temporary files are deleted by a detached process so that "
+        "zimit exits without waiting for their deletion, whose completion is logged "
+        "separately. The container (if any) must keep running until then.",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--warc2zim-subprocess",
+        help="If set, run warc2zim conversion in a dedicated child process instead "
+        "of inside zimit process.",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--warc2zim-max-memory",
+        help="Maximum memory (address space, in bytes) warc2zim conversion is allowed "
+        "to use. Implies --warc2zim-subprocess.",
+        type=int,
+    )
+
+    parser.add_argument(
+        "--warc2zim-max-cpu-time",
+        help="Maximum CPU time (in seconds) warc2zim conversion is allowed to use. "
+        "Implies --warc2zim-subprocess.",
+        type=int,
+    )
+
+    parser.add_argument(
+        "--warc2zim-check-cache-dir",
+        help="Directory where successful checks of warc2zim arguments are cached, so "
+        "that they are not checked again by next runs. Default is "
+        "$XDG_CACHE_HOME/zimit or ~/.cache/zimit.",
+    )
+
+    parser.add_argument(
+        "--metrics-port",
+        help="If set, serve crawl and conversion metrics in Prometheus text format "
+        "over HTTP on this port, at /metrics",
+        type=int,
+    )
+
     parser.add_argument(
         "--acceptable-crawler-exit-codes",
         help="Non-zero crawler exit codes to consider as acceptable to continue with "
         " conversion of WARC to ZIM. Flag partialZim will be set in statsFilename (if "
         " used). Single value with individual error codes separated by comma",
+        type=parse_exit_codes,
+        default=set(),
     )
 
     # by design, all unknown args are for warc2zim ; known one are either for crawler
     # or shared
     known_args, warc2zim_args = parser.parse_known_args(raw_args)
 
+    if known_args.warcs_download_concurrency < 1:
+        parser.error("--warcs-download-concurrency must be a positive integer")
+    if known_args.crawler_shards < 1:
+        parser.error("--crawler-shards must be a positive integer")
+    if known_args.crawler_shards > 1 and known_args.resume:
+        parser.error("--resume is not supported with --crawler-shards")
+    if known_args.adaptive_workers:
+        if known_args.crawler_shards > 1:
+            parser.error("--adaptive-workers is not supported with --crawler-shards")
+        if not 1 <= known_args.min_workers <= known_args.max_workers:
+            parser.error("--min-workers must be between 1 and --max-workers")
+    if known_args.baseline_sitemap_only:
+        if not known_args.baseline_warcs or not known_args.useSitemap:
+            parser.error(
+                "--baseline-sitemap-only requires --baseline-warcs and --useSitemap"
+            )
+        if known_args.depth is not None:
+            parser.error("--baseline-sitemap-only is not supported with --depth")
+        known_args.depth = 0
+    if known_args.index_warcs_during_crawl and not (
+        known_args.baseline_warcs or known_args.dedup_payloads
+    ):
+        parser.error(
+            "--index-warcs-during-crawl requires --baseline-warcs or --dedup-payloads"
+        )
+
+    # heavy dependencies are imported only now so that --help and --version (which
+    # exit while parsing arguments) do not pay for them
+    from zimit.metrics import Metrics, MetricsServer  # noqa: PLC0415
+    from zimit.utils import (  # noqa: PLC0415
+        DownloadProgress,
+        download_file,
+        download_files,
+    )
+    from zimit.warcs import (  # noqa: PLC0415
+        ClosedWarcWatcher,
+        WarcIndexer,
+        dedup_warcs,
+        extract_tar_gz,
+        extract_tar_warcs,
+        filter_warc,
+        get_earliest_date,
+        get_indexed_uris,
+        index_warcs,
+        iter_warc_files,
+    )
+
     # pass a scraper suffix to warc2zim so that both zimit and warc2zim versions are
     # associated with the ZIM ; make it a CSV for easier parsing
     warc2zim_args.append("--scraper-suffix")
@@ -796,16 +1038,35 @@ def run(raw_args):
     if known_args.adminEmail:
         user_agent_suffix += f" {known_args.adminEmail}"
 
+    # identity of the job, to only resume a previous run of the same job
+    job = {
+        "seeds": known_args.seeds,
+        "seedFile": known_args.seedFile,
+        "zim": get_zim_name(warc2zim_args),
+    }
+
     # set temp dir to use for this crawl
-    global temp_root_dir  # noqa: PLW0603
+    global temp_root_dir, background_cleanup  # noqa: PLW0603
+    background_cleanup = known_args.background_cleanup
     if known_args.build:
         # use build dir argument if passed
         temp_root_dir = Path(known_args.build)
         temp_root_dir.mkdir(parents=True, exist_ok=True)
+    elif known_args.resume and (
+        previous_build_dir := find_previous_build_dir(Path(known_args.output), job)
+    ):
+        logger.info(f"Resuming previous run from {previous_build_dir}")
+        temp_root_dir = previous_build_dir
     else:
         # make new randomized temp dir
         temp_root_dir = Path(tempfile.mkdtemp(dir=known_args.output, prefix=".tmp"))
+    write_job(temp_root_dir, job)
 
+    metrics = Metrics(temp_root_dir, get_phase_durations=timer.get_wall_times)
+    if known_args.metrics_port is not None:
+        MetricsServer(metrics, known_args.metrics_port).start()
+
+    timer.start_phase("seeds")
     seeds = []
     if known_args.seeds:
         seeds += [get_cleaned_url(url) for url in known_args.seeds.split(",")]
@@ -852,22 +1113,40 @@ def run(raw_args):
     if known_args.overwrite:
         warc2zim_args.append("--overwrite")
 
+    zim_path = get_zim_path(warc2zim_args)
+    timer.report_path = (
+        zim_path.with_suffix(".timings.json")
+        if zim_path
+        else Path(known_args.output) / "zimit.timings.json"
+    )
+
+    timer.start_phase("warc2zim_check")
     logger.info("----------")
     logger.info("Testing warc2zim args")
     logger.info("Running: warc2zim " + " ".join(warc2zim_args))
-    res = warc2zim(warc2zim_args)
+    res = check_warc2zim_args(
+        warc2zim_args,
+        (
+            Path(known_args.warc2zim_check_cache_dir)
+            if known_args.warc2zim_check_cache_dir
+            else get_default_cache_dir()
+        ),
+    )
     if res != NORMAL_WARC2ZIM_EXIT_CODE:
         logger.info("Exiting, invalid warc2zim params")
         return EXIT_CODE_WARC2ZIM_CHECK_FAILED
+    timer.start_phase("setup")
 
     # only trigger cleanup when the keep argument is passed without a custom build dir.
-    if not known_args.build and not known_args.keep:
-        atexit.register(cleanup)
+    # when resumable, temporary files are kept until the ZIM has been created instead
+    if not known_args.build and not known_args.keep and not known_args.resume:
+        register_cleanup()
 
     # copy / download custom behaviors to one single folder and configure crawler
     if known_args.custom_behaviors:
+        timer.start_phase("custom_behaviors")
         behaviors_dir = temp_root_dir / "custom-behaviors"
-        behaviors_dir.mkdir()
+        behaviors_dir.mkdir(exist_ok=True)
         for custom_behavior in [
             custom_behavior.strip()
             for custom_behavior in known_args.custom_behaviors.split(",")
@@ -891,9 +1170,45 @@ def run(raw_args):
                 )
                 shutil.copy(custom_behavior, behaviors_file.name)
         known_args.customBehaviors = str(behaviors_dir)
+        timer.start_phase("setup")
     else:
         known_args.customBehaviors = None
 
+    completed_crawl = None
+    if known_args.resume:
+        completed_crawl = get_completed_crawl(temp_root_dir)
+        if crawl_state := get_latest_crawl_state(temp_root_dir):
+            # saved state holds the whole crawl config, arguments taking precedence
+            logger.info(f"Restarting crawl from saved state {crawl_state}")
+            known_args.config = str(crawl_state)
+        if not known_args.saveState:
+            # also save state periodically so that a crashed crawl can be resumed
+            known_args.saveState = "always"
+
+    baseline_warc_files: list[Path] = []
+    if known_args.baseline_warcs:
+        timer.start_phase("baseline")
+        baseline_warc_files = list(
+            iter_warc_files(
+                Path(location.strip())
+                for location in known_args.baseline_warcs.split(",")
+            )
+        )
+        if not baseline_warc_files:
+            raise Exception(f"No WARC file found at {known_args.baseline_warcs}")
+        logger.info(f"Indexing {len(baseline_warc_files)} baseline WARC files")
+        index_warcs(baseline_warc_files, temp_root_dir / "warc-index")
+        if known_args.useSitemap and not known_args.sitemapFromDate:
+            if baseline_date := get_earliest_date(
+                baseline_warc_files, temp_root_dir / "warc-index"
+            ):
+                logger.info(
+                    f"Only adding sitemap URLs modified since baseline crawl "
+                    f"({baseline_date})"
+                )
+                known_args.sitemapFromDate = baseline_date
+        timer.start_phase("setup")
+
     crawler_args = get_crawler_cmd_line(known_args)
     for seed in seeds:
         crawler_args.append("--seeds")
@@ -936,12 +1251,22 @@ def run(raw_args):
         zimit_stats_file.parent.mkdir(parents=True, exist_ok=True)
     zimit_stats_file.unlink(missing_ok=True)
 
-    if known_args.zimit_progress_file:
+    # where crawler (each crawler shard) writes its WARC files
+    collections_dirs = [
+        shard_dir / "collections"
+        for shard_dir in get_shard_dirs(temp_root_dir, known_args.crawler_shards)
+    ]
+
+    watcher = None
+    if known_args.zimit_progress_file or known_args.metrics_port is not None:
         # setup inotify crawler progress watcher
         watcher = ProgressFileWatcher(
             zimit_stats_path=zimit_stats_file,
             crawl_stats_path=crawler_stats_file,
             warc2zim_stats_path=warc2zim_stats_file,
+            interval=known_args.zimit_progress_interval,
+            warcs_paths=collections_dirs,
+            metrics=metrics,
         )
         logger.info(
             f"Writing zimit progress to {watcher.zimit_stats_path}, crawler progress to"
@@ -978,70 +1303,211 @@ def run(raw_args):
 
     partial_zim = False
 
+    crawler_processes = CrawlerProcesses()
+    disk_guard = None
+    if known_args.disk_budget or known_args.disk_reserve:
+        disk_guard = DiskGuard(
+            temp_root_dir,
+            crawler_processes.interrupt,
+            budget=known_args.disk_budget,
+            reserve=known_args.disk_reserve,
+        )
+    # intermediate files are deleted as soon as possible when disk space is limited,
+    # unless asked to keep them
+    delete_intermediates = bool(disk_guard) and not known_args.keep
+
     # if warc files are passed, do not run browsertrix crawler but fetch the files if
     # they are provided as an HTTP URL + extract the archive if it is a tar.gz
     warc_files: list[Path] = []
     if known_args.warcs:
-        for warc_location in [
+        timer.start_phase("warcs")
+        warc_locations = [
             warc_location.strip() for warc_location in known_args.warcs.split(",")
-        ]:
+        ]
+        suffixes: dict[str, str] = {}
+        downloads: dict[str, Path] = {}
+        stream_extracts: dict[str, Path] = {}
+        # inputs prepared by a previous run with the same build dir are reused
+        manifest = ConversionManifest(temp_root_dir / "conversion-manifest.json")
+        prepared: dict[str, Path] = {}
+        for warc_location in warc_locations:
             suffix = "".join(Path(urllib.parse.urlparse(warc_location).path).suffixes)
             if suffix not in {".tar", ".tar.gz", ".warc", ".warc.gz"}:
                 raise Exception(f"Unsupported file at {warc_location}")
+            suffixes[warc_location] = suffix
 
-            filename = tempfile.NamedTemporaryFile(
-                dir=temp_root_dir,
-                prefix="warc_",
-                suffix=suffix,
-                delete_on_close=False,
-            )
+            if prepared_path := manifest.get(warc_location):
+                logger.info(f"Reusing {prepared_path} prepared for {warc_location}")
+                prepared[warc_location] = prepared_path
+                continue
 
             if not re.match(r"^https?\://", warc_location):
-                # warc_location is not a URL, so it is a path, simply add it to the list
+                # warc_location is not a URL, so it is a path
                 if not Path(warc_location).exists():
                     raise Exception(f"Impossible to find file at {warc_location}")
+                continue
 
-                # if it is a plain warc or warc.gz, simply add it to the list
-                if suffix in {".warc", ".warc.gz"}:
-                    warc_files.append(Path(warc_location))
-                    continue
-
-                # otherwise extract tar.gz but do not delete it afterwards
-                extract_path = temp_root_dir / f"{filename.name}_files"
-                logger.info(
-                    f"Extracting WARC(s) from {warc_location} to {extract_path}"
+            if known_args.warcs_stream_extract and suffix in {".tar", ".tar.gz"}:
+                # warc_location is a URL to an archive, extract it while downloading
+                stream_extracts[warc_location] = Path(
+                    tempfile.mkdtemp(dir=temp_root_dir, prefix="warc_", suffix="_files")
                 )
-                with tarfile.open(warc_location, "r") as fh:
-                    # Extract all the contents to the specified directory
-                    fh.extractall(path=extract_path, filter="data")
-                warc_files.append(Path(extract_path))
                 continue
 
-            # warc_location is a URL, let's download it to a temp name to avoid name
-            # collisions
-            warc_file = Path(filename.name)
-            logger.info(f"Downloading WARC(s) from {warc_location} to {warc_file}")
-            download_file(warc_location, warc_file)
+            if known_args.build:
+                # warc_location is a URL, name it after its URL so that it can be
+                # reused (or resumed) should zimit run again with the same build dir
+                url_digest = hashlib.sha256(warc_location.encode()).hexdigest()[:16]
+                downloads[warc_location] = temp_root_dir / f"warc_{url_digest}{suffix}"
+                continue
+
+            # warc_location is a URL, it will be downloaded to a temp name to avoid
+            # name collisions
+            fd, warc_file = tempfile.mkstemp(
+                dir=temp_root_dir, prefix="warc_", suffix=suffix
+            )
+            os.close(fd)
+            downloads[warc_location] = Path(warc_file)
+
+        # all URLs are downloaded first, in parallel
+        if downloads or stream_extracts:
+            logger.info(
+                f"Downloading {len(downloads) + len(stream_extracts)} WARC(s) with "
+                f"{known_args.warcs_download_concurrency} parallel downloads"
+            )
+            download_files(
+                downloads,
+                stream_extracts=stream_extracts,
+                concurrency=known_args.warcs_download_concurrency,
+                chunk_size=known_args.warcs_download_chunk_size,
+                progress=DownloadProgress(
+                    zimit_stats_file if known_args.zimit_progress_file else None,
+                    metrics=metrics,
+                ),
+                verify_checksum=known_args.warcs_verify_checksum,
+                reuse_existing=bool(known_args.build),
+            )
+
+        for warc_location in warc_locations:
+            suffix = suffixes[warc_location]
+            if warc_location in prepared:
+                warc_files.append(prepared[warc_location])
+                continue
+            if warc_location in stream_extracts:
+                manifest.add(warc_location, stream_extracts[warc_location])
+                warc_files.append(stream_extracts[warc_location])
+                continue
+            warc_file = downloads.get(warc_location, Path(warc_location))
 
             # if it is a plain warc or warc.gz, simply add it to the list
             if suffix in {".warc", ".warc.gz"}:
+                if warc_location in downloads:
+                    manifest.add(warc_location, warc_file)
                 warc_files.append(warc_file)
                 continue
 
-            # otherwise extract tar.gz and delete it afterwards
-            extract_path = temp_root_dir / f"{filename.name}_files"
+            # otherwise extract tar.gz, and delete it afterwards if it was downloaded
+            extract_path = Path(
+                tempfile.mkdtemp(dir=temp_root_dir, prefix="warc_", suffix="_files")
+            )
             logger.info(f"Extracting WARC(s) from {warc_file} to {extract_path}")
-            with tarfile.open(warc_file, "r") as fh:
-                # Extract all the contents to the specified directory
-                fh.extractall(path=extract_path, filter="data")
-            logger.info(f"Deleting archive at {warc_file}")
-            warc_file.unlink()
-            warc_files.append(Path(extract_path))
+            if suffix == ".tar":
+                # uncompressed, WARC files can be copied straight from the archive
+                extract_tar_warcs(warc_file, extract_path)
+            else:
+                extract_tar_gz(warc_file, extract_path)
+            if warc_location in downloads:
+                logger.info(f"Deleting archive at {warc_file}")
+                warc_file.unlink()
+            manifest.add(warc_location, extract_path)
+            warc_files.append(extract_path)
 
     else:
-        logger.info(f"Running browsertrix-crawler crawl: {cmd_line}")
-        crawl = subprocess.run(crawler_args, check=False)
-        if (
+        warc_indexer = None
+        warc_watcher = None
+        if known_args.index_warcs_during_crawl and completed_crawl is None:
+            warc_indexer = WarcIndexer(temp_root_dir / "warc-index")
+            warc_watcher = ClosedWarcWatcher(collections_dirs, warc_indexer)
+            logger.info("Indexing WARC files in the background as they are closed")
+            warc_watcher.watch()
+        if completed_crawl is not None:
+            logger.info("Crawl already completed by previous run, skipping it")
+            crawl = subprocess.CompletedProcess(crawler_args, completed_crawl[0])
+        else:
+            logger.info(f"Running browsertrix-crawler crawl: {cmd_line}")
+            timer.start_phase("crawl")
+            if disk_guard:
+                disk_guard.watch()
+            if known_args.crawler_shards > 1:
+                crawl = subprocess.CompletedProcess(
+                    crawler_args,
+                    run_sharded_crawl(
+                        crawler_args,
+                        temp_root_dir,
+                        known_args.crawler_shards,
+                        known_args.crawler_redis_url,
+                        on_start=crawler_processes.add,
+                    ),
+                )
+            elif known_args.adaptive_workers:
+                # page latency is measured from crawler statistics
+                if "--statsFilename" not in crawler_args:
+                    crawler_args += ["--statsFilename", str(crawler_stats_file)]
+                crawl = subprocess.CompletedProcess(
+                    crawler_args,
+                    run_adaptive_crawl(
+                        crawler_args,
+                        temp_root_dir,
+                        WorkersAutoscaler(
+                            known_args.min_workers,
+                            known_args.max_workers,
+                            crawler_stats_file,
+                        ),
+                        workers=min(
+                            max(known_args.workers or 1, known_args.min_workers),
+                            known_args.max_workers,
+                        ),
+                        interval=known_args.adaptive_workers_interval,
+                        on_start=crawler_processes.add,
+                    ),
+                )
+            else:
+                with subprocess.Popen(crawler_args) as process:
+                    crawler_processes.add(process)
+                    try:
+                        process.wait()
+                    except BaseException:
+                        # same as subprocess.run, do not leave crawler running
+                        process.kill()
+                        raise
+                crawl = subprocess.CompletedProcess(crawler_args, process.returncode)
+            if disk_guard:
+                disk_guard.stop()
+        if warc_watcher:
+            warc_watcher.stop()
+        if completed_crawl and completed_crawl[1]:
+            logger.info(
+                "Crawl stopped before its end by previous run. Continuing with "
+                "warc2zim conversion."
+            )
+            if known_args.zimit_progress_file:
+                partial_zim = True
+        elif (
+            disk_guard
+            and disk_guard.exhausted
+            and crawl.returncode
+            in (
+                0,
+                EXIT_CODE_CRAWLER_INTERRUPTED,
+            )
+        ):
+            logger.info(
+                "Crawl stopped to stay within disk budget. Continuing with warc2zim "
+                "conversion."
+            )
+            if known_args.zimit_progress_file:
+                partial_zim = True
+        elif (
             crawl.returncode == EXIT_CODE_CRAWLER_SIZE_LIMIT_HIT
             and known_args.sizeSoftLimit
         ):
@@ -1059,16 +1525,33 @@ def run(raw_args):
             )
             if known_args.zimit_progress_file:
                 partial_zim = True
+        elif crawl.returncode in known_args.acceptable_crawler_exit_codes:
+            logger.info(
+                f"Crawl returned an acceptable error: {crawl.returncode}. Continuing "
+                "with warc2zim conversion of what has been crawled."
+            )
+            if known_args.zimit_progress_file:
+                partial_zim = True
         elif crawl.returncode != 0:
             logger.error(
                 f"Crawl returned an error: {crawl.returncode}, scraper exiting"
             )
             cancel_cleanup()
             return crawl.returncode
+        if known_args.resume and completed_crawl is None:
+            # any non-zero code reaching here is an acceptable partial crawl
+            mark_crawl_complete(
+                temp_root_dir,
+                crawl.returncode,
+                partial=bool(crawl.returncode or (disk_guard and disk_guard.exhausted)),
+            )
+        if delete_intermediates:
+            delete_artifacts([temp_root_dir / "custom-behaviors"])
 
         if known_args.collection:
             warc_files = [
-                temp_root_dir.joinpath(f"collections/{known_args.collection}/archive/")
+                collections_dir / known_args.collection / "archive"
+                for collections_dir in collections_dirs
             ]
 
         else:
@@ -1089,6 +1572,52 @@ def run(raw_args):
                     logger.info(f"- {directory}")
             warc_files = warc_dirs
 
+        if warc_indexer:
+            logger.info("Waiting for background WARC files indexing to complete")
+            warc_indexer.wait()
+
+    if baseline_warc_files:
+        timer.start_phase("baseline")
+        index_dir = temp_root_dir / "warc-index"
+        new_warc_files = list(iter_warc_files(warc_files))
+        index_warcs(new_warc_files, index_dir)
+        # records of URLs crawled again are superseded by new ones
+        crawled_uris = get_indexed_uris(new_warc_files, index_dir)
+        baseline_dir = temp_root_dir / "baseline"
+        baseline_dir.mkdir(exist_ok=True)
+        nb_records = sum(
+            filter_warc(
+                baseline_warc_file,
+                index_dir,
+                crawled_uris,
+                baseline_dir / f"{index:05}-{baseline_warc_file.name}",
+            )
+            for index, baseline_warc_file in enumerate(baseline_warc_files)
+        )
+        logger.info(f"Merging {nb_records} records of URLs not crawled from baseline")
+        warc_files.append(baseline_dir)
+
+    if known_args.dedup_payloads:
+        timer.start_phase("dedup")
+        index_dir = temp_root_dir / "warc-index"
+        all_warc_files = list(iter_warc_files(warc_files))
+        index_warcs(all_warc_files, index_dir)
+        dedup_dir = temp_root_dir / "dedup"
+        dedup_dir.mkdir(exist_ok=True)
+        warc_files, nb_duplicates = dedup_warcs(all_warc_files, index_dir, dedup_dir)
+        logger.info(f"Found {nb_duplicates} records with an already seen payload")
+        if delete_intermediates and not known_args.build and not known_args.resume:
+            # WARC files of the build dir rewritten without duplicates
+            delete_artifacts(
+                path
+                for path in set(all_warc_files).difference(warc_files)
+                if path.is_relative_to(temp_root_dir)
+            )
+
+    if delete_intermediates:
+        # only needed to prepare conversion inputs (baseline, dedup)
+        delete_artifacts([temp_root_dir / "warc-index"])
+
     logger.info("")
     logger.info("----------")
     logger.info(
@@ -1098,23 +1627,56 @@ def run(raw_args):
     warc2zim_args.extend(str(warc_file) for warc_file in warc_files)
 
     logger.info(f"Calling warc2zim with these args: {warc2zim_args}")
+    timer.start_phase("conversion")
+
+    if (
+        known_args.warc2zim_subprocess
+        or known_args.warc2zim_max_memory
+        or known_args.warc2zim_max_cpu_time
+    ):
+        warc2zim_exit_code = run_warc2zim_process(
+            warc2zim_args,
+            temp_root_dir,
+            max_memory=known_args.warc2zim_max_memory,
+            max_cpu_time=known_args.warc2zim_max_cpu_time,
+        )
+    else:
+        from warc2zim.main import main as warc2zim  # noqa: PLC0415
 
-    warc2zim_exit_code = warc2zim(warc2zim_args)
+        warc2zim_exit_code = warc2zim(warc2zim_args)
+    timer.stop()
+
+    if watcher:
+        watcher.stop()
 
     if known_args.zimit_progress_file:
         stats_content = json.loads(zimit_stats_file.read_bytes())
         stats_content["partialZim"] = partial_zim
-        zimit_stats_file.write_text(json.dumps(stats_content))
+        write_json_atomically(zimit_stats_file, stats_content)
 
     # also call cancel_cleanup when --keep, even if it is not supposed to be registered,
     # so that we will display temporary files location just like in other situations
     if warc2zim_exit_code or known_args.keep:
         cancel_cleanup()
+    elif known_args.resume and not known_args.build:
+        cleanup()
 
     return warc2zim_exit_code
 
 
+def parse_exit_codes(value: str) -> set[int]:
+    """Set of exit codes from a comma-separated list"""
+    try:
+        return {int(code) for code in value.split(",") if code.strip()}
+    except ValueError:
+        raise ArgumentTypeError(
+            f"invalid exit codes: {value} (expecting comma-separated integers)"
+        ) from None
+
+
 def get_cleaned_url(url: str):
+    from zimscraperlib.uri import rebuild_uri  # noqa: PLC0415
+
     parsed_url = urllib.parse.urlparse(url)
 
     # remove explicit port in URI for default-for-scheme as browsers does it
@@ -1250,6 +1812,10 @@ def sigint_handler(*args):  # noqa: ARG001
 
 
 def zimit():
+    if sys.argv[1:2] == ["batch"]:
+        from zimit.batch import run_batch  # noqa: PLC0415
+
+        sys.exit(run_batch(sys.argv[2:]))
     sys.exit(run(sys.argv[1:]))
 
 
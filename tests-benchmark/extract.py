@@ -0,0 +1,65 @@
+import io
+import logging
+import os
+import shutil
+import tarfile
+import time
+
+import pytest
+
+from zimit.warcs import GZIP_DECOMPRESSORS, extract_tar_gz
+
+BENCHMARK_SIZE_MB = int(os.getenv("BENCHMARK_SIZE_MB", "512"))
+NB_MEMBERS = 16
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture(scope="module")
+def tar_gz_path(tmp_path_factory):
+    """A tar.gz of NB_MEMBERS members, BENCHMARK_SIZE_MB in total once extracted"""
+    path = tmp_path_factory.mktemp("archive") / "warcs.tar.gz"
+    member_size = BENCHMARK_SIZE_MB * 1024 * 1024 // NB_MEMBERS
+    with tarfile.open(path, "w:gz", compresslevel=1) as tar:
+        for idx in range(NB_MEMBERS):
+            # half random (incompressible) half repetitive content, like WARC.gz
+            # holding mixed media and text
+            content = os.urandom(member_size // 2) + b"<html></html>" * (
+                member_size // 2 // 13
+            )
+            info = tarfile.TarInfo(f"archive/rec-{idx}.warc.gz")
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return path
+
+
+def _timed_extract(tar_gz_path, extract_path, decompressor):
+    extract_path.mkdir()
+    start = time.perf_counter()
+    if decompressor is None:
+        # current reference path, Python's tarfile + zlib
+        with tarfile.open(tar_gz_path, "r") as fh:
+            fh.extractall(path=extract_path, filter="data")
+    else:
+        extract_tar_gz(tar_gz_path, extract_path, decompressor=decompressor)
+    return time.perf_counter() - start
+
+
+@pytest.mark.parametrize(
+    "decompressor",
+    [pytest.param(None, id="python")]
+    + [
+        pytest.param([name, *args], id=name)
+        for name, args in GZIP_DECOMPRESSORS.items()
+    ],
+)
+def test_extract_tar_gz(tar_gz_path, tmp_path, decompressor):
+    if decompressor and not shutil.which(decompressor[0]):
+        pytest.skip(f"{decompressor[0]} is not available")
+    duration = _timed_extract(tar_gz_path, tmp_path / "files", decompressor)
+    logger.warning(
+        f"{decompressor[0] if decompressor else 'python'}: extracted "
+        f"{BENCHMARK_SIZE_MB} MB in {duration:.2f}s "
+        f"({BENCHMARK_SIZE_MB / duration:.0f} MB/s)"
+    )
+    assert len(list((tmp_path / "files" / "archive").iterdir())) == NB_MEMBERS
@@ -12,3 +12,8 @@ from zimit import zimit as app
 @pytest.fixture(autouse=True)
 def disable_zimit_cleanup(monkeypatch):
     monkeypatch.setattr(app, "cleanup", lambda: None)
+
+
+@pytest.fixture(autouse=True)
+def isolate_zimit_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
@@ -0,0 +1,137 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from zimit.autoscale import (
+    WorkersAutoscaler,
+    get_process_tree_rss,
+    run_adaptive_crawl,
+    set_crawler_arg,
+)
+
+GIB = 1024**3
+
+# fake crawler: saves its state when interrupted, completes when restarted from it
+FAKE_CRAWLER = """
+import pathlib, signal, sys, time
+args = sys.argv[1:]
+cwd = pathlib.Path(args[args.index("--cwd") + 1])
+with open(cwd / "runs.txt", "a") as fh:
+    fh.write(" ".join(args) + "\\n")
+if "--config" in args:
+    sys.exit(0)
+
+def interrupt(*_):
+    state = cwd / "collections" / "crawl-1" / "crawls" / "crawl-state.yaml"
+    state.parent.mkdir(parents=True)
+    state.write_text("state: {}")
+    sys.exit(11)
+
+signal.signal(signal.SIGINT, interrupt)
+time.sleep(60)
+sys.exit(1)
+"""
+
+
+def get_sample(
+    cpu_load: float, memory_available: float, latency: float | None = None
+) -> dict[str, float | None]:
+    return {
+        "cpu_load": cpu_load,
+        "memory_total": 64 * GIB,
+        "memory_available": memory_available * 64 * GIB,
+        "browsers_rss": 4 * GIB,
+        "page_latency": latency,
+    }
+
+
+def test_set_crawler_arg():
+    assert set_crawler_arg(
+        ["crawl", "--workers", "2", "--depth", "1"], "--workers", "4"
+    ) == [
+        "crawl",
+        "--depth",
+        "1",
+        "--workers",
+        "4",
+    ]
+    assert set_crawler_arg(["crawl"], "--config", "state.yaml") == [
+        "crawl",
+        "--config",
+        "state.yaml",
+    ]
+
+
+def test_target_workers(tmp_path: Path):
+    autoscaler = WorkersAutoscaler(2, 16, tmp_path / "crawl.json")
+    # idle host, workers are added
+    assert autoscaler.get_target_workers(4, get_sample(0.2, 0.8, 10)) == 6
+    # busy CPU or low memory, workers are removed
+    assert autoscaler.get_target_workers(8, get_sample(1.5, 0.8)) == 6
+    assert autoscaler.get_target_workers(8, get_sample(0.2, 0.1)) == 6
+    # in-between, nothing changes
+    assert autoscaler.get_target_workers(8, get_sample(0.7, 0.3)) == 8
+    # time spent per page has increased, workers are not added
+    assert autoscaler.get_target_workers(6, get_sample(0.2, 0.8, 20)) == 6
+    # bounds are enforced
+    assert autoscaler.get_target_workers(2, get_sample(1.5, 0.8)) == 2
+    assert autoscaler.get_target_workers(16, get_sample(0.2, 0.8)) == 16
+
+
+def test_target_workers_memory_bound(tmp_path: Path):
+    autoscaler = WorkersAutoscaler(1, 64, tmp_path / "crawl.json")
+    # 32 GiB available above low threshold
+    sample = get_sample(0.2, 0.65)
+    # each worker uses 20 GiB, only one more fits
+    assert autoscaler.get_target_workers(4, sample | {"browsers_rss": 80 * GIB}) == 5
+    # each worker uses 2 GiB, 16 more fit
+    assert autoscaler.get_target_workers(40, sample | {"browsers_rss": 80 * GIB}) == 56
+
+
+def test_page_latency(tmp_path: Path):
+    stats_path = tmp_path / "crawl.json"
+    autoscaler = WorkersAutoscaler(1, 8, stats_path)
+    assert autoscaler.get_page_latency(4, now=0) is None
+    stats_path.write_text(json.dumps({"crawled": 10}))
+    assert autoscaler.get_page_latency(4, now=10) is None
+    stats_path.write_text(json.dumps({"crawled": 30}))
+    # 4 workers crawled 20 pages in 10 seconds
+    assert autoscaler.get_page_latency(4, now=20) == 2
+
+
+def test_process_tree_rss():
+    with subprocess.Popen(
+        [sys.executable, "-c", "import time; time.sleep(10)"]
+    ) as child:
+        try:
+            own_rss = get_process_tree_rss(child.pid)
+            assert own_rss > 0
+            assert get_process_tree_rss(os.getpid()) > own_rss
+        finally:
+            child.kill()
+
+
+class FixedAutoscaler(WorkersAutoscaler):
+    def measure(self, pid: int, workers: int, now: float | None = None):  # noqa: ARG002
+        return get_sample(0.2, 0.8)
+
+    def get_target_workers(self, workers: int, sample):  # noqa: ARG002
+        return 3
+
+
+def test_run_adaptive_crawl(tmp_path: Path):
+    crawler_args = [sys.executable, "-c", FAKE_CRAWLER, "--cwd", str(tmp_path)]
+    autoscaler = FixedAutoscaler(1, 4, tmp_path / "crawl.json")
+
+    assert (
+        run_adaptive_crawl(crawler_args, tmp_path, autoscaler, workers=2, interval=0.5)
+        == 0
+    )
+
+    runs = (tmp_path / "runs.txt").read_text().splitlines()
+    assert runs[0].endswith("--workers 2")
+    state = tmp_path / "collections" / "crawl-1" / "crawls" / "crawl-state.yaml"
+    assert f"--config {state}" in runs[1]
+    assert runs[1].endswith("--workers 3")
@@ -0,0 +1,116 @@
+import json
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+from zimit import zimit as app
+from zimit.batch import get_job_args, load_manifest, run_batch, run_job
+from zimit.constants import NORMAL_WARC2ZIM_EXIT_CODE
+
+TEST_DATA_DIR = Path(__file__).parent / "data"
+
+
+def test_get_job_args():
+    assert get_job_args(["--name", "example", "--workers", 2]) == [
+        "--name",
+        "example",
+        "--workers",
+        "2",
+    ]
+    assert get_job_args(
+        {
+            "seeds": "https://example.com",
+            "workers": 2,
+            "useSitemap": True,
+            "keep": False,
+            "title": None,
+            "exclude": ["a", "b"],
+        }
+    ) == [
+        "--seeds",
+        "https://example.com",
+        "--workers",
+        "2",
+        "--useSitemap",
+        "--exclude",
+        "a",
+        "--exclude",
+        "b",
+    ]
+
+
+def test_load_manifest(tmp_path: Path):
+    manifest = tmp_path / "jobs.jsonl"
+    manifest.write_text(
+        '{"id": "first", "args": ["--name", "first"]}\n'
+        "\n"
+        '{"args": {"name": "second"}}\n'
+    )
+    assert load_manifest(manifest) == [
+        {"id": "first", "args": ["--name", "first"]},
+        {"id": "job-3", "args": ["--name", "second"]},
+    ]
+
+    manifest.write_text('{"id": "first", "args": []}\n{"id": "first", "args": []}\n')
+    with pytest.raises(ValueError, match="Duplicate job id"):
+        load_manifest(manifest)
+
+    manifest.write_text('{"id": "first"}\n')
+    with pytest.raises(ValueError, match=r"jobs.jsonl:1"):
+        load_manifest(manifest)
+
+
+def test_run_batch(tmp_path: Path):
+    manifest = tmp_path / "jobs.jsonl"
+    manifest.write_text(
+        '{"id": "version", "args": ["--version"]}\n'
+        '{"id": "invalid", "args": {"workers": "many"}}\n'
+    )
+
+    assert run_batch([str(manifest), "--concurrency", "2"]) == 1
+
+    results = {
+        result["id"]: result
+        for result in map(
+            json.loads, (tmp_path / "jobs.results.jsonl").read_text().splitlines()
+        )
+    }
+    assert results["version"]["returncode"] == 0
+    assert results["version"]["timings"]["total"]["wall_time"] > 0
+    assert results["invalid"]["returncode"] == 2
+
+
+def test_run_job(tmp_path: Path, monkeypatch):
+    def fake_main(args):
+        # arguments check (without any WARC) or actual conversion, which returns
+        # None on success
+        if not any(arg.endswith(".warc") for arg in args):
+            return NORMAL_WARC2ZIM_EXIT_CODE
+        return None
+
+    monkeypatch.setitem(
+        sys.modules, "warc2zim.main", types.SimpleNamespace(main=fake_main)
+    )
+    cleanups = []
+    monkeypatch.setattr(app, "cleanup", lambda: cleanups.append(app.temp_root_dir))
+
+    returncode, timings = run_job(
+        [
+            "--seeds",
+            "https://example.com",
+            "--warcs",
+            str(TEST_DATA_DIR / "example-response.warc"),
+            "--output",
+            str(tmp_path),
+            "--name",
+            "example",
+        ]
+    )
+
+    assert returncode == 0
+    assert timings["total"]["wall_time"] > 0
+    # temporary files are deleted once the job is over, not at exit
+    assert cleanups == [app.temp_root_dir]
+    assert not app.cleanup_pending
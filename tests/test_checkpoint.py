@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from zimit.checkpoint import ConversionManifest
+
+
+def test_manifest_reuse(tmp_path: Path):
+    archive = tmp_path / "warcs.tar"
+    archive.write_bytes(b"archive")
+    extract_path = tmp_path / "build" / "warc_files"
+    extract_path.mkdir(parents=True)
+    (extract_path / "rec-0.warc.gz").write_bytes(b"warc")
+    manifest_path = tmp_path / "build" / "conversion-manifest.json"
+
+    manifest = ConversionManifest(manifest_path)
+    assert manifest.get(str(archive)) is None
+    manifest.add(str(archive), extract_path)
+    manifest.add("https://example.com/rec.warc.gz", extract_path / "rec-0.warc.gz")
+
+    # as loaded by a rerun
+    manifest = ConversionManifest(manifest_path)
+    assert manifest.get(str(archive)) == extract_path
+    assert (
+        manifest.get("https://example.com/rec.warc.gz")
+        == extract_path / "rec-0.warc.gz"
+    )
+
+    # incomplete extraction is not reused
+    (extract_path / "rec-0.warc.gz").write_bytes(b"wa")
+    assert manifest.get(str(archive)) is None
+    assert manifest.get("https://example.com/rec.warc.gz") is None
+
+    # neither is a prepared input whose source has changed
+    manifest.add(str(archive), extract_path)
+    archive.write_bytes(b"another archive")
+    assert manifest.get(str(archive)) is None
+
+
+def test_manifest_invalid(tmp_path: Path):
+    manifest_path = tmp_path / "conversion-manifest.json"
+    manifest_path.write_text("{")
+    assert ConversionManifest(manifest_path).inputs == {}
@@ -0,0 +1,52 @@
+import os
+import sys
+from pathlib import Path
+
+from zimit.cleanup import (
+    DELETING_PREFIX,
+    delete_in_background,
+    delete_tree,
+    rename_aside,
+)
+
+
+def make_tree(root: Path) -> int:
+    """Create a tree of files in root, returning the number of files created"""
+    nb_files = 0
+    for crawl in range(3):
+        archive = root / "collections" / f"crawl-{crawl}" / "archive"
+        archive.mkdir(parents=True)
+        for idx in range(50):
+            (archive / f"rec-{idx}.warc").write_bytes(b"x" * 100)
+            nb_files += 1
+    outside = root.parent / "outside"
+    outside.mkdir()
+    (outside / "kept.txt").write_text("kept")
+    # links are deleted, not followed
+    (root / "link-to-dir").symlink_to(outside)
+    (root / "link-to-file").symlink_to(outside / "kept.txt")
+    return nb_files + 2
+
+
+def test_delete_tree(tmp_path: Path):
+    root = tmp_path / ".tmpbuild"
+    nb_files = make_tree(root)
+
+    assert delete_tree(root, max_workers=4) == nb_files
+    assert not root.exists()
+    assert (tmp_path / "outside" / "kept.txt").read_text() == "kept"
+
+
+def test_rename_aside_and_delete_in_background(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join(sys.path))
+    root = tmp_path / ".tmpbuild"
+    make_tree(root)
+
+    aside = rename_aside(root)
+    assert not root.exists()
+    assert aside == tmp_path / f"{DELETING_PREFIX}.tmpbuild"
+
+    process = delete_in_background(aside)
+    assert process.wait(timeout=30) == 0
+    assert not aside.exists()
+    assert sorted(os.listdir(tmp_path)) == ["outside"]
@@ -0,0 +1,88 @@
+import json
+import signal
+import subprocess
+import sys
+import types
+
+import pytest
+
+from zimit.constants import NORMAL_WARC2ZIM_EXIT_CODE
+from zimit.conversion import (
+    ProgressPipeReader,
+    check_warc2zim_args,
+    run_warc2zim_process,
+)
+
+
+@pytest.fixture
+def warc2zim_calls(monkeypatch):
+    """Replace warc2zim main by a fake one recording its calls"""
+    calls = []
+
+    def fake_main(args):
+        calls.append(args)
+        return NORMAL_WARC2ZIM_EXIT_CODE
+
+    monkeypatch.setitem(
+        sys.modules, "warc2zim.main", types.SimpleNamespace(main=fake_main)
+    )
+    return calls
+
+
+def test_check_warc2zim_args_cached(tmp_path, warc2zim_calls):
+    output = tmp_path / "output"
+    output.mkdir()
+    cache_dir = tmp_path / "cache"
+    args = ["--name", "test", "--zim-file", "test.zim", "--output", str(output)]
+
+    assert check_warc2zim_args(args, cache_dir) == NORMAL_WARC2ZIM_EXIT_CODE
+    assert check_warc2zim_args(args, cache_dir) == NORMAL_WARC2ZIM_EXIT_CODE
+    assert len(warc2zim_calls) == 1
+
+    # other args are checked again
+    assert check_warc2zim_args([*args, "--title", "Test"], cache_dir) == (
+        NORMAL_WARC2ZIM_EXIT_CODE
+    )
+    assert len(warc2zim_calls) == 2
+
+    # ZIM already exists, warc2zim has to tell what to do
+    (output / "test.zim").touch()
+    check_warc2zim_args(args, cache_dir)
+    assert len(warc2zim_calls) == 3
+
+
+def test_progress_pipe_reader(tmp_path):
+    progress_path = tmp_path / "warc2zim.json"
+    reader = ProgressPipeReader(tmp_path / "progress.fifo", progress_path)
+    reader.start()
+    # mimic warc2zim which rewrites its whole progress file for every record
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            (
+                "import json, sys\n"
+                "for written in range(1, 101):\n"
+                "    with open(sys.argv[1], 'w') as fh:\n"
+                "        json.dump({'written': written, 'total': 100}, fh)\n"
+            ),
+            str(reader.fifo_path),
+        ],
+        check=True,
+    )
+    reader.stop()
+
+    assert json.loads(progress_path.read_text()) == {"written": 100, "total": 100}
+    assert not reader.fifo_path.exists()
+
+
+def test_run_warc2zim_process_limits(tmp_path, monkeypatch):
+    # fake warc2zim, spinning forever
+    (tmp_path / "warc2zim").mkdir()
+    (tmp_path / "warc2zim" / "__init__.py").touch()
+    (tmp_path / "warc2zim" / "main.py").write_text("while True:\n    pass\n")
+    monkeypatch.setenv("PYTHONPATH", str(tmp_path))
+
+    returncode = run_warc2zim_process([], tmp_path, max_cpu_time=1)
+    # soft and hard limits being the same, kernel might directly send SIGKILL
+    assert returncode in (128 + signal.SIGXCPU, 128 + signal.SIGKILL)
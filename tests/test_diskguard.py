@@ -0,0 +1,94 @@
+import signal
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+from zimit.diskguard import CrawlerProcesses, DiskGuard, delete_artifacts
+from zimit.shards import get_shard_dirs, run_shards
+
+
+def test_disk_guard_budget(tmp_path: Path):
+    exhausted = threading.Event()
+    guard = DiskGuard(tmp_path, exhausted.set, budget=100_000, interval=0.05)
+    assert guard.check() is None
+
+    guard.watch()
+    (tmp_path / "rec.warc").write_bytes(b"x" * 200_000)
+    assert exhausted.wait(timeout=5)
+    guard.stop()
+    assert guard.exhausted
+
+
+def test_disk_guard_reserve(tmp_path: Path):
+    guard = DiskGuard(tmp_path, lambda: None, reserve=2**62)
+    assert "left on volume" in (guard.check() or "")
+    guard = DiskGuard(tmp_path, lambda: None, reserve=1)
+    assert guard.check() is None
+
+
+def test_delete_artifacts(tmp_path: Path):
+    (tmp_path / "behaviors").mkdir()
+    (tmp_path / "behaviors" / "behavior.js").write_bytes(b"x" * 10_000)
+    (tmp_path / "rec.warc").write_bytes(b"x" * 10_000)
+
+    freed = delete_artifacts(
+        [tmp_path / "behaviors", tmp_path / "rec.warc", tmp_path / "missing"]
+    )
+    assert freed >= 20_000
+    assert list(tmp_path.iterdir()) == []
+
+
+def make_crawler(tmp_path: Path) -> Path:
+    """Fake crawler started through its shebang line, like browsertrix `crawl`,
+    exiting with 11 once interrupted"""
+    crawler = tmp_path / "crawl"
+    crawler.write_text(
+        f"#!{sys.executable}\n"
+        "import signal, sys, time\n"
+        "signal.signal(signal.SIGINT, lambda *_: sys.exit(11))\n"
+        "print('ready', flush=True)\n"
+        "time.sleep(30)\n"
+        "sys.exit(1)\n"
+    )
+    crawler.chmod(0o755)
+    return crawler
+
+
+def test_crawler_processes_interrupted(tmp_path: Path):
+    crawler = make_crawler(tmp_path)
+    processes = CrawlerProcesses()
+    with subprocess.Popen([str(crawler)], stdout=subprocess.PIPE) as process:
+        processes.add(process)
+        assert process.stdout
+        assert process.stdout.readline() == b"ready\n"
+        processes.interrupt()
+        assert process.wait(timeout=10) == 11
+
+    # crawler started once crawl is being stopped is interrupted at once
+    with subprocess.Popen([str(crawler)]) as process:
+        processes.add(process)
+        assert process.wait(timeout=10) in (11, -signal.SIGINT)
+
+
+def test_disk_guard_stops_shards(tmp_path: Path):
+    crawler = make_crawler(tmp_path)
+    build_dir = tmp_path / "build"
+    build_dir.mkdir()
+    processes = CrawlerProcesses()
+    guard = DiskGuard(build_dir, processes.interrupt, budget=100_000, interval=0.05)
+    guard.watch()
+    timer = threading.Timer(
+        0.5, (build_dir / "rec.warc").write_bytes, args=(b"x" * 200_000,)
+    )
+    timer.start()
+
+    returncode = run_shards(
+        [str(crawler), "--cwd", str(build_dir)],
+        get_shard_dirs(build_dir, 2),
+        "redis://host/0",
+        on_start=processes.add,
+    )
+    guard.stop()
+    assert guard.exhausted
+    assert returncode == 11
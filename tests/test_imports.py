@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# modules which are costly to import and are not needed to display help or version
+HEAVY_MODULES = ("warc2zim", "libzim", "requests", "warcio", "inotify")
+
+# generous budget, import is expected to take well below on any decent machine
+IMPORT_TIME_BUDGET_US = 500_000
+
+
+def run_with_importtime(code: str) -> dict[str, int]:
+    """Run Python code with -X importtime, returning cumulative import time (in
+    microseconds) of each top-level import"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        imports[name.strip()] = int(cumulative)
+    return imports
+
+
+@pytest.mark.parametrize("arg", ["--help", "--version"])
+def test_help_version_do_not_import_heavy_modules(arg):
+    imports = run_with_importtime(
+        "from zimit.zimit import run\n"
+        "try:\n"
+        f"    run(['{arg}'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+    )
+    assert "zimit.zimit" in imports
+    for name in imports:
+        assert name.split(".")[0] not in HEAVY_MODULES
+
+
+def test_import_time():
+    imports = run_with_importtime("import zimit.zimit")
+    assert imports["zimit.zimit"] < IMPORT_TIME_BUDGET_US
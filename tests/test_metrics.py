@@ -0,0 +1,83 @@
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+from zimit.metrics import Metrics, MetricsServer
+from zimit.timings import PhaseTimer
+
+
+@pytest.fixture
+def timer() -> PhaseTimer:
+    return PhaseTimer()
+
+
+@pytest.fixture
+def metrics_server(tmp_path: Path, timer: PhaseTimer):
+    server = MetricsServer(
+        Metrics(tmp_path, get_phase_durations=timer.get_wall_times),
+        port=0,
+        host="127.0.0.1",
+    )
+    server.start()
+    yield server
+    server.stop()
+
+
+def scrape(server: MetricsServer, path: str = "/metrics") -> dict[str, float]:
+    with urllib.request.urlopen(f"http://127.0.0.1:{server.port}{path}") as response:
+        assert response.headers["Content-Type"].startswith("text/plain")
+        return {
+            line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+            for line in response.read().decode().splitlines()
+            if not line.startswith("#")
+        }
+
+
+def test_metrics_served(
+    metrics_server: MetricsServer, timer: PhaseTimer, tmp_path: Path
+):
+    metrics = metrics_server.metrics
+    (tmp_path / "rec.warc").write_bytes(b"x" * 10000)
+
+    timer.start_phase("crawl")
+    metrics.update(
+        {
+            "done": 10,
+            "total": 111,
+            "phase": "crawl",
+            "eta_seconds": 30,
+            "warc_bytes": 10000,
+            "rates": {"pages_per_second": 2.5, "warc_bytes_per_second": None},
+        },
+        {"crawled": 10, "total": 100, "pending": 4, "failed": 1},
+    )
+    values = scrape(metrics_server)
+    assert values["zimit_crawl_pages_crawled"] == 10
+    assert values["zimit_crawl_pages_total"] == 100
+    assert values["zimit_crawl_pages_pending"] == 4
+    assert values["zimit_crawl_pages_failed"] == 1
+    assert values["zimit_crawl_pages_per_second"] == 2.5
+    assert values["zimit_eta_seconds"] == 30
+    assert values["zimit_temp_dir_bytes"] >= 10000
+    assert 'zimit_phase_duration_seconds{phase="crawl"}' in values
+    # unknown rates are not exposed
+    assert "zimit_crawl_warc_bytes_per_second" not in values
+
+    timer.start_phase("conversion")
+    metrics.update(
+        {"done": 60, "total": 100, "phase": "conversion", "rates": {}},
+        {"written": 50, "total": 100},
+    )
+    timer.stop()
+    values = scrape(metrics_server)
+    assert values["zimit_conversion_records_written"] == 50
+    assert values['zimit_phase_duration_seconds{phase="crawl"}'] >= 0
+    assert values['zimit_phase_duration_seconds{phase="conversion"}'] >= 0
+
+
+def test_metrics_not_found(metrics_server: MetricsServer):
+    with pytest.raises(urllib.error.HTTPError) as exc_info:
+        scrape(metrics_server, "/")
+    assert exc_info.value.code == 404
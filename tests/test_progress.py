@@ -0,0 +1,163 @@
+import json
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from inotify.calls import InotifyError
+
+from zimit import progress
+from zimit.progress import ProgressFileWatcher, ProgressModel, write_json_atomically
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    watcher = ProgressFileWatcher(
+        crawl_stats_path=tmp_path / "crawl.json",
+        warc2zim_stats_path=tmp_path / "warc2zim.json",
+        zimit_stats_path=tmp_path / "stats.json",
+        interval=0.2,
+    )
+    watcher.watch()
+    yield watcher
+    watcher.stop()
+
+
+def test_progress_aggregated(watcher: ProgressFileWatcher):
+    watcher.crawl_stats_path.write_text(json.dumps({"crawled": 45, "total": 90}))
+    time.sleep(0.5)
+    stats = json.loads(watcher.zimit_stats_path.read_text())
+    assert stats["phase"] == "crawl"
+    assert (stats["done"], stats["total"]) == (45, 100)
+
+    watcher.warc2zim_stats_path.write_text(json.dumps({"written": 50, "total": 100}))
+    watcher.stop()
+    stats = json.loads(watcher.zimit_stats_path.read_text())
+    assert stats["phase"] == "conversion"
+    assert (stats["done"], stats["total"]) == (95, 100)
+
+
+def test_progress_writes_coalesced(monkeypatch, tmp_path: Path):
+    writes = []
+
+    def write_json_atomically(fpath, data):  # noqa: ARG001
+        writes.append(data)
+
+    monkeypatch.setattr(progress, "write_json_atomically", write_json_atomically)
+    watcher = ProgressFileWatcher(
+        crawl_stats_path=tmp_path / "crawl.json",
+        warc2zim_stats_path=tmp_path / "warc2zim.json",
+        zimit_stats_path=tmp_path / "stats.json",
+        interval=10,
+    )
+    watcher.watch()
+    for crawled in range(1, 201):
+        watcher.crawl_stats_path.write_text(
+            json.dumps({"crawled": crawled, "total": 200})
+        )
+    watcher.stop()
+
+    # first modification is written immediately, all others when stopping
+    assert len(writes) <= 2
+    assert writes[-1]["done"] == 200
+
+
+def test_progress_files_hammered(watcher: ProgressFileWatcher):
+    nb_updates = 500
+    stop_reading = threading.Event()
+    torn_reads = []
+
+    def crawler():
+        # crawler writes in place, in many chunks
+        for crawled in range(1, nb_updates + 1):
+            content = json.dumps({"crawled": crawled, "total": nb_updates * 0.9})
+            with open(watcher.crawl_stats_path, "w") as fh:
+                for char in content:
+                    fh.write(char)
+                    fh.flush()
+
+    def warc2zim():
+        for written in range(1, nb_updates + 1):
+            write_json_atomically(
+                watcher.warc2zim_stats_path,
+                {"written": written, "total": nb_updates},
+            )
+
+    def poller():
+        while not stop_reading.is_set():
+            try:
+                content = watcher.zimit_stats_path.read_text()
+            except FileNotFoundError:
+                continue
+            try:
+                json.loads(content)
+            except json.JSONDecodeError:
+                torn_reads.append(content)
+
+    poller_thread = threading.Thread(target=poller)
+    poller_thread.start()
+    writers = [threading.Thread(target=target) for target in (crawler, warc2zim)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    # conversion is the last phase
+    write_json_atomically(
+        watcher.warc2zim_stats_path, {"written": nb_updates, "total": nb_updates}
+    )
+    watcher.stop()
+    stop_reading.set()
+    poller_thread.join()
+
+    assert not torn_reads
+    stats = json.loads(watcher.zimit_stats_path.read_text())
+    assert (stats["done"], stats["total"]) == (nb_updates, nb_updates)
+
+
+def test_progress_model(tmp_path: Path):
+    collections_dirs = [tmp_path / "collections", tmp_path / "shard-1" / "collections"]
+    warc = collections_dirs[0] / "crawl" / "archive" / "rec.warc.gz"
+    warc.parent.mkdir(parents=True)
+    model = ProgressModel(collections_dirs, conversion_bytes_rate=1000)
+
+    warc.write_bytes(b"x" * 1000)
+    stats = model.crawl_progress({"crawled": 10, "total": 100}, now=0)
+    assert stats["eta_seconds"] is None
+    assert stats["total"] == 111  # default crawl share: 90%
+
+    # 10 pages per second, so 8s of crawl remaining, 9s in total
+    # 10kB of WARC (from all shards) expected at the end of crawl, so 10s of
+    # conversion
+    shard_warc = collections_dirs[1] / "crawl" / "archive" / "rec.warc.gz"
+    shard_warc.parent.mkdir(parents=True)
+    shard_warc.write_bytes(b"x" * 1000)
+    stats = model.crawl_progress({"crawled": 20, "total": 100}, now=1)
+    assert stats["phase"] == "crawl"
+    assert stats["rates"] == {
+        "pages_per_second": 10,
+        "warc_bytes_per_second": 1000,
+    }
+    assert stats["warc_bytes"] == 2000
+    assert stats["eta_seconds"] == 8 + 10
+    # crawl is 9s out of 19s
+    assert (stats["done"], stats["total"]) == (20, int(100 * 19 / 9))
+
+    stats = model.warc2zim_progress({"written": 0, "total": 600}, now=200)
+    assert stats["eta_seconds"] is None
+    stats = model.warc2zim_progress({"written": 300, "total": 600}, now=210)
+    assert stats["phase"] == "conversion"
+    assert stats["rates"] == {"records_per_second": 30}
+    assert stats["eta_seconds"] == 10
+    assert (stats["done"], stats["total"]) == (int(600 * (9 + 10 / 2) / 19), 600)
+
+
+def test_watch_setup_error_raised(tmp_path: Path):
+    # parent directory of crawler progress file does not exist
+    watcher = ProgressFileWatcher(
+        crawl_stats_path=tmp_path / "missing" / "crawl.json",
+        warc2zim_stats_path=tmp_path / "warc2zim.json",
+        zimit_stats_path=tmp_path / "stats.json",
+    )
+    with pytest.raises(InotifyError):
+        watcher.watch()
+    assert watcher.thread is None
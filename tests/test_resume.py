@@ -0,0 +1,62 @@
+import os
+from pathlib import Path
+
+from zimit.resume import (
+    find_previous_build_dir,
+    get_completed_crawl,
+    get_latest_crawl_state,
+    mark_crawl_complete,
+    write_job,
+)
+
+JOB = {"seeds": "https://example.com", "seedFile": None, "zim": "example"}
+
+
+def make_build_dir(
+    output_dir: Path, name: str, mtime: int, job: dict | None = JOB
+) -> Path:
+    build_dir = output_dir / name
+    (build_dir / "collections").mkdir(parents=True)
+    if job:
+        write_job(build_dir, job)
+    os.utime(build_dir, (mtime, mtime))
+    return build_dir
+
+
+def test_find_previous_build_dir(tmp_path: Path):
+    assert find_previous_build_dir(tmp_path, JOB) is None
+
+    make_build_dir(tmp_path, ".tmpold", 1000)
+    latest = make_build_dir(tmp_path, ".tmplatest", 2000)
+    # not a build dir of a crawl
+    (tmp_path / ".tmpempty").mkdir()
+    make_build_dir(tmp_path, "other", 3000)
+    # build dirs of another job, or of an unknown one
+    make_build_dir(tmp_path, ".tmpother", 4000, {**JOB, "zim": "other"})
+    make_build_dir(tmp_path, ".tmpunknown", 5000, None)
+
+    assert find_previous_build_dir(tmp_path, JOB) == latest
+
+
+def test_get_latest_crawl_state(tmp_path: Path):
+    assert get_latest_crawl_state(tmp_path) is None
+
+    crawls_dir = tmp_path / "collections" / "crawl-1" / "crawls"
+    crawls_dir.mkdir(parents=True)
+    for index, name in enumerate(["crawl-2.yaml", "crawl-1.yaml"]):
+        (crawls_dir / name).write_text("state: {}")
+        os.utime(crawls_dir / name, (index, index))
+
+    assert get_latest_crawl_state(tmp_path) == crawls_dir / "crawl-1.yaml"
+
+
+def test_crawl_complete_marker(tmp_path: Path):
+    assert get_completed_crawl(tmp_path) is None
+    mark_crawl_complete(tmp_path, 0)
+    assert get_completed_crawl(tmp_path) == (0, False)
+    # e.g. crawl interrupted once disk budget was exhausted
+    mark_crawl_complete(tmp_path, 11, partial=True)
+    assert get_completed_crawl(tmp_path) == (11, True)
+    # marker written by previous versions
+    (tmp_path / "crawl-complete.json").write_text('{"returncode": 14}')
+    assert get_completed_crawl(tmp_path) == (14, False)
@@ -0,0 +1,114 @@
+import shutil
+import socket
+import sys
+from pathlib import Path
+
+import pytest
+
+from zimit.shards import (
+    RedisServer,
+    get_shard_args,
+    get_shard_dirs,
+    run_shards,
+)
+
+# fake crawler, recording its working directory and exiting with given code
+FAKE_CRAWLER = """
+import pathlib, sys
+cwd = pathlib.Path(sys.argv[sys.argv.index("--cwd") + 1])
+(cwd / "args.txt").write_text(" ".join(sys.argv[1:]))
+sys.exit(int(sys.argv[1]))
+"""
+
+
+def test_get_shard_args(tmp_path: Path):
+    crawler_args = ["crawl", "--cwd", "/build", "--statsFilename", "crawl.json"]
+    assert get_shard_args(crawler_args, 0, tmp_path, "redis://host/0") == [
+        "crawl",
+        "--cwd",
+        str(tmp_path),
+        "--statsFilename",
+        "crawl.json",
+        "--redisStoreUrl",
+        "redis://host/0",
+    ]
+    # only first shard writes crawl statistics
+    assert get_shard_args(crawler_args, 1, tmp_path, "redis://host/0") == [
+        "crawl",
+        "--cwd",
+        str(tmp_path),
+        "--redisStoreUrl",
+        "redis://host/0",
+    ]
+
+
+def test_get_shard_args_ports(tmp_path: Path):
+    crawler_args = [
+        "crawl",
+        "--healthCheckPort",
+        "6065",
+        "--screencastPort",
+        "0",
+        "--debugAccessBrowser",
+        "--cwd",
+        "/build",
+    ]
+    assert get_shard_args(crawler_args, 0, tmp_path, "redis://host/0") == [
+        "crawl",
+        "--healthCheckPort",
+        "6065",
+        "--screencastPort",
+        "0",
+        "--debugAccessBrowser",
+        "--cwd",
+        str(tmp_path),
+        "--redisStoreUrl",
+        "redis://host/0",
+    ]
+    # each shard gets its own ports, browser is only exposed by first shard
+    assert get_shard_args(crawler_args, 2, tmp_path, "redis://host/0") == [
+        "crawl",
+        "--healthCheckPort",
+        "6067",
+        "--screencastPort",
+        "0",
+        "--cwd",
+        str(tmp_path),
+        "--redisStoreUrl",
+        "redis://host/0",
+    ]
+
+
+def test_get_shard_dirs(tmp_path: Path):
+    assert get_shard_dirs(tmp_path, 1) == [tmp_path]
+    assert get_shard_dirs(tmp_path, 3) == [
+        tmp_path,
+        tmp_path / "shard-1",
+        tmp_path / "shard-2",
+    ]
+
+
+@pytest.mark.parametrize("exit_code", [0, 11])
+def test_run_shards(tmp_path: Path, exit_code: int):
+    cwds = get_shard_dirs(tmp_path, 3)
+    crawler_args = [sys.executable, "-c", FAKE_CRAWLER, str(exit_code), "--cwd", "."]
+
+    assert run_shards(crawler_args, cwds, "redis://host/0") == exit_code
+    for cwd in cwds:
+        assert (
+            (cwd / "args.txt")
+            .read_text()
+            .endswith(f"--cwd {cwd} --redisStoreUrl redis://host/0")
+        )
+
+
+@pytest.mark.skipif(not shutil.which("redis-server"), reason="redis-server missing")
+def test_redis_server(tmp_path: Path):
+    redis = RedisServer(tmp_path)
+    redis.start()
+    try:
+        with socket.create_connection(("127.0.0.1", redis.port)) as sock:
+            sock.sendall(b"PING\r\n")
+            assert sock.recv(7) == b"+PONG\r\n"
+    finally:
+        redis.stop()
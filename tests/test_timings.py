@@ -0,0 +1,45 @@
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from zimit.timings import PhaseTimer
+
+
+def test_phases_timing_report(tmp_path: Path):
+    timer = PhaseTimer()
+    timer.report_path = tmp_path / "report.timings.json"
+
+    timer.start_phase("wait")
+    time.sleep(0.2)
+    timer.start_phase("child")
+    subprocess.run(
+        [sys.executable, "-c", "sum(range(10_000_000))"],
+        check=True,
+    )
+    assert set(timer.get_wall_times()) == {"wait", "child"}
+    timer.start_phase("wait")
+    time.sleep(0.1)
+    timer.stop()
+    timer.write_report()
+
+    report = json.loads(timer.report_path.read_text())
+    assert list(report["phases"]) == ["wait", "child"]
+    for usage in [report["total"], *report["phases"].values()]:
+        assert set(usage) == {
+            "wall_time",
+            "cpu_time",
+            "peak_rss",
+            "bytes_read",
+            "bytes_written",
+        }
+    # same phase started twice is accumulated
+    assert report["phases"]["wait"]["wall_time"] >= 0.3
+    assert report["phases"]["wait"]["cpu_time"] < 0.3
+    # CPU time of child processes is accounted
+    assert report["phases"]["child"]["cpu_time"] > 0
+    assert report["phases"]["child"]["peak_rss"] > 0
+    assert report["total"]["wall_time"] >= sum(
+        usage["wall_time"] for usage in report["phases"].values()
+    )
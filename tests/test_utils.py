@@ -0,0 +1,308 @@
+import hashlib
+import io
+import json
+import re
+import tarfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from zimit.utils import (
+    DownloadProgress,
+    _PrefetchReader,
+    download_file,
+    download_files,
+    stream_extract_tar,
+)
+
+
+class FilesServer(ThreadingHTTPServer):
+    """Serve in-memory files, with Range support, optionally cutting the first
+    response of each file in the middle"""
+
+    def __init__(self, *, cut_first_response: bool = False):
+        super().__init__(("127.0.0.1", 0), FilesHandler)
+        self.files: dict[str, bytes] = {}
+        self.cut_first_response = cut_first_response
+        # like pre-signed object store URLs, only valid for GET
+        self.reject_head = False
+        # seconds to wait between chunks of bodies sent, to simulate slow transfers
+        self.chunk_delay = 0
+        self.requests: list[tuple[str, str | None]] = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FilesHandler(BaseHTTPRequestHandler):
+    server: FilesServer
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        if self.server.reject_head:
+            self.send_error(403)
+            return
+        self.send_file(send_body=False)
+
+    def do_GET(self):
+        self.send_file(send_body=True)
+
+    def send_file(self, *, send_body: bool):
+        content = self.server.files.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+        range_header = self.headers.get("Range")
+        if send_body:
+            self.server.requests.append((self.path, range_header))
+        etag = f'"{hashlib.sha256(content).hexdigest()[:16]}"'
+        if self.headers.get("If-Range") not in (None, etag):
+            # file changed, whole file is sent back
+            range_header = None
+        start = 0
+        if range_header:
+            start = int(
+                re.match(r"bytes=(\d+)-", range_header).group(1)
+            )  # pyright: ignore
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}"
+            )
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(content) - start))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        if not send_body:
+            return
+        body = content[start:]
+        first = [path for path, _ in self.server.requests].count(self.path) == 1
+        if self.server.cut_first_response and first:
+            self.wfile.write(body[: len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        if self.server.chunk_delay:
+            for offset in range(0, len(body), 1024):
+                self.wfile.write(body[offset : offset + 1024])
+                time.sleep(self.server.chunk_delay)
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(request):
+    server = FilesServer(cut_first_response=getattr(request, "param", False))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def test_download_files(tmp_path, server):
+    contents = {f"file{idx}.warc": bytes([idx]) * (idx * 100_000) for idx in range(5)}
+    for name, content in contents.items():
+        server.files[f"/{name}"] = content
+    stats_path = tmp_path / "stats.json"
+
+    download_files(
+        {f"{server.url}/{name}": tmp_path / name for name in contents},
+        concurrency=3,
+        chunk_size=4096,
+        progress=DownloadProgress(stats_path),
+    )
+
+    for name, content in contents.items():
+        assert (tmp_path / name).read_bytes() == content
+    stats = json.loads(stats_path.read_text())
+    assert stats["done"] == stats["total"] == sum(map(len, contents.values()))
+    assert len(stats["downloads"]) == len(contents)
+    assert stats["phase"] == "download"
+
+
+def test_download_files_stops_on_error(tmp_path, server):
+    server.files["/file.warc"] = b"warc content"
+    downloads = {f"{server.url}/missing.warc": tmp_path / "missing.warc"}
+    downloads.update(
+        {f"{server.url}/file.warc": tmp_path / f"file{idx}.warc" for idx in range(5)}
+    )
+
+    with pytest.raises(requests.HTTPError):
+        download_files(downloads, concurrency=1)
+
+    # downloads pending when the error occurred have not been started (the worker
+    # might have picked the next one before the error is handled)
+    assert len(server.requests) <= 1
+
+
+def test_download_files_aborts_running_on_error(tmp_path, server):
+    # would take 10s to be fully sent
+    server.files["/slow.warc"] = b"x" * 1024 * 500
+    server.chunk_delay = 0.02
+    downloads = {
+        f"{server.url}/slow.warc": tmp_path / "slow.warc",
+        f"{server.url}/missing.warc": tmp_path / "missing.warc",
+    }
+
+    start = time.monotonic()
+    with pytest.raises(requests.HTTPError):
+        download_files(downloads, concurrency=2, chunk_size=1024)
+
+    assert time.monotonic() - start < 5
+    assert not (tmp_path / "slow.warc").exists()
+
+
+@pytest.mark.parametrize("server", [True], indirect=True)
+def test_download_file_resumes(tmp_path, server, monkeypatch):
+    monkeypatch.setattr("zimit.utils.DOWNLOAD_BACKOFF_FACTOR", 0)
+    server.files["/file.warc"] = content = bytes(range(256)) * 4000
+    fpath = tmp_path / "file.warc"
+
+    download_file(f"{server.url}/file.warc", fpath, chunk_size=1024)
+
+    assert fpath.read_bytes() == content
+    assert not (tmp_path / "file.warc.part").exists()
+    assert server.requests[0] == ("/file.warc", None)
+    assert server.requests[1] == ("/file.warc", f"bytes={len(content) // 2}-")
+
+
+@pytest.mark.parametrize(
+    "part, validator",
+    [
+        # left by a previous run, unknown validator
+        (b"old", None),
+        # remote file changed since previous run
+        (b"old", '"old"'),
+    ],
+)
+def test_download_file_restarts(tmp_path, server, part, validator):
+    server.files["/file.warc"] = content = b"new warc content"
+    fpath = tmp_path / "file.warc"
+    (tmp_path / "file.warc.part").write_bytes(part)
+    if validator:
+        (tmp_path / "file.warc.part.validator").write_text(validator)
+
+    download_file(f"{server.url}/file.warc", fpath)
+
+    assert fpath.read_bytes() == content
+    assert not (tmp_path / "file.warc.part.validator").exists()
+
+
+def test_download_file_invalid_part(tmp_path, server):
+    server.files["/file.warc"] = content = b"new warc content"
+    etag = f'"{hashlib.sha256(content).hexdigest()[:16]}"'
+    fpath = tmp_path / "file.warc"
+    (tmp_path / "file.warc.part").write_bytes(b"x" * 100)
+    (tmp_path / "file.warc.part.validator").write_text(etag)
+
+    download_file(f"{server.url}/file.warc", fpath)
+
+    assert fpath.read_bytes() == content
+    assert server.requests == [("/file.warc", "bytes=100-"), ("/file.warc", None)]
+
+
+def test_download_file_checksum(tmp_path, server):
+    server.files["/file.warc"] = content = b"warc content"
+    server.files["/file.warc.sha256"] = (
+        f"{hashlib.sha256(content).hexdigest()}  file.warc\n".encode()
+    )
+    server.files["/bad.warc"] = content
+    server.files["/bad.warc.sha256"] = f"{'0' * 64}  bad.warc\n".encode()
+
+    download_file(
+        f"{server.url}/file.warc", tmp_path / "file.warc", verify_checksum=True
+    )
+    assert (tmp_path / "file.warc").read_bytes() == content
+
+    with pytest.raises(OSError, match="Checksum mismatch"):
+        download_file(
+            f"{server.url}/bad.warc", tmp_path / "bad.warc", verify_checksum=True
+        )
+    assert not (tmp_path / "bad.warc").exists()
+
+
+def test_download_file_reuse_existing(tmp_path, server):
+    server.files["/file.warc"] = b"warc content"
+    fpath = tmp_path / "file.warc"
+
+    download_file(f"{server.url}/file.warc", fpath, reuse_existing=True)
+    download_file(f"{server.url}/file.warc", fpath, reuse_existing=True)
+    assert len(server.requests) == 1
+
+    # size changed on server, file has to be downloaded again
+    server.files["/file.warc"] = b"new warc content"
+    download_file(f"{server.url}/file.warc", fpath, reuse_existing=True)
+    assert fpath.read_bytes() == b"new warc content"
+
+
+def test_download_file_reuse_existing_head_rejected(tmp_path, server):
+    server.files["/file.warc"] = b"warc content"
+    fpath = tmp_path / "file.warc"
+    download_file(f"{server.url}/file.warc", fpath)
+    server.reject_head = True
+
+    download_file(f"{server.url}/file.warc", fpath, reuse_existing=True)
+    # size is probed with the first byte only
+    assert server.requests[1:] == [("/file.warc", "bytes=0-0")]
+
+
+def test_download_file_checksum_query(tmp_path, server):
+    # e.g. a pre-signed URL
+    server.files["/file.warc?signature=abc"] = content = b"warc content"
+    server.files["/file.warc.sha256?signature=abc"] = (
+        f"{hashlib.sha256(content).hexdigest()}  file.warc\n".encode()
+    )
+
+    download_file(
+        f"{server.url}/file.warc?signature=abc",
+        tmp_path / "file.warc",
+        verify_checksum=True,
+    )
+    assert (tmp_path / "file.warc").read_bytes() == content
+
+
+def test_stream_extract_tar(tmp_path, server):
+    contents = {f"rec-{idx}.warc.gz": bytes([idx]) * 50_000 for idx in range(3)}
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+        for name, content in contents.items():
+            info = tarfile.TarInfo(f"archive/{name}")
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    server.files["/warcs.tar.gz"] = archive.getvalue()
+    progress = []
+
+    stream_extract_tar(
+        f"{server.url}/warcs.tar.gz",
+        tmp_path,
+        chunk_size=1024,
+        on_progress=lambda done, total: progress.append((done, total)),
+    )
+
+    for name, content in contents.items():
+        assert (tmp_path / "archive" / name).read_bytes() == content
+    assert progress[-1] == (len(archive.getvalue()), len(archive.getvalue()))
+
+
+def test_prefetch_reader_stops_on_close():
+    # endless stream, whose prefetching would block forever on a full queue
+    stream = io.RawIOBase()
+    stream.read = lambda size: b"x" * size  # pyright: ignore
+    reader = _PrefetchReader(stream, 1024)
+    assert reader.read(10) == b"x" * 10
+
+    reader.close()
+    reader.thread.join(timeout=5)
+    assert not reader.thread.is_alive()
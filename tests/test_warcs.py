@@ -0,0 +1,240 @@
+import io
+import json
+import pathlib
+import tarfile
+
+import pytest
+from warcio.archiveiterator import ArchiveIterator
+from warcio.statusandheaders import StatusAndHeaders
+from warcio.warcwriter import WARCWriter
+
+from zimit.warcs import (
+    dedup_warcs,
+    extract_tar_gz,
+    extract_tar_warcs,
+    filter_warc,
+    get_earliest_date,
+    get_index_path,
+    get_indexed_uris,
+    index_warc,
+    index_warcs,
+    iter_warc_files,
+)
+
+TEST_DATA_DIR = pathlib.Path(__file__).parent / "data"
+
+
+def test_index_warc(tmp_path):
+    warc_file = TEST_DATA_DIR / "example-response.warc"
+    index_file = get_index_path(tmp_path, warc_file)
+    nb_records = index_warc(warc_file, index_file)
+    entries = [json.loads(line) for line in index_file.read_text().splitlines()]
+    assert nb_records == len(entries)
+    assert any(
+        entry["type"] == "response" and entry["uri"] == "http://example.com/"
+        for entry in entries
+    )
+    assert all(entry["length"] for entry in entries)
+
+
+def test_iter_warc_files():
+    assert list(iter_warc_files([TEST_DATA_DIR])) == [
+        TEST_DATA_DIR / "example-response.warc"
+    ]
+
+
+def test_extract_tar_warcs(tmp_path):
+    warc_content = (TEST_DATA_DIR / "example-response.warc").read_bytes()
+    tar_path = tmp_path / "warcs.tar"
+    with tarfile.open(tar_path, "w") as tar:
+        for name in ("archive/rec-1.warc", "archive/rec-2.warc.gz", "pages.jsonl"):
+            info = tarfile.TarInfo(name)
+            info.size = len(warc_content)
+            tar.addfile(info, io.BytesIO(warc_content))
+
+    extract_path = tmp_path / "files"
+    assert extract_tar_warcs(tar_path, extract_path) == 2
+
+    assert (extract_path / "archive/rec-1.warc").read_bytes() == warc_content
+    assert (extract_path / "archive/rec-2.warc.gz").read_bytes() == warc_content
+    assert not (extract_path / "pages.jsonl").exists()
+
+
+@pytest.mark.parametrize(
+    "decompressor",
+    [
+        pytest.param(["gzip", "-d", "-c"], id="external"),
+        pytest.param(["false"], id="fallback"),
+    ],
+)
+def test_extract_tar_gz(tmp_path, decompressor):
+    warc_content = (TEST_DATA_DIR / "example-response.warc").read_bytes()
+    tar_path = tmp_path / "warcs.tar.gz"
+    with tarfile.open(tar_path, "w:gz") as tar:
+        info = tarfile.TarInfo("archive/rec-1.warc")
+        info.size = len(warc_content)
+        tar.addfile(info, io.BytesIO(warc_content))
+
+    extract_path = tmp_path / "files"
+    extract_path.mkdir()
+    extract_tar_gz(tar_path, extract_path, decompressor=decompressor)
+
+    assert (extract_path / "archive/rec-1.warc").read_bytes() == warc_content
+
+
+def test_index_warcs(tmp_path):
+    warc_files = []
+    for idx in range(3):
+        directory = tmp_path / f"crawl-{idx}" / "archive"
+        directory.mkdir(parents=True)
+        warc_file = directory / f"rec-{idx}.warc"
+        warc_file.write_bytes((TEST_DATA_DIR / "example-response.warc").read_bytes())
+        warc_files.append(warc_file)
+    index_dir = tmp_path / "index"
+
+    nb_records = index_warcs(warc_files, index_dir, max_workers=2)
+    assert nb_records == dict.fromkeys(warc_files, 3)
+    # indexes are up-to-date, nothing is indexed again
+    assert index_warcs(warc_files, index_dir) == nb_records
+
+
+def test_filter_baseline_warc(tmp_path):
+    warc_file = TEST_DATA_DIR / "example-response.warc"
+    index_dir = tmp_path / "index"
+    index_warcs([warc_file], index_dir)
+
+    assert get_indexed_uris([warc_file], index_dir) == {"http://example.com/"}
+    assert get_earliest_date([warc_file], index_dir) == "2016-02-25T04:23:29Z"
+
+    # URIs crawled again are not kept from the baseline
+    output_file = tmp_path / "excluded.warc"
+    assert filter_warc(warc_file, index_dir, {"http://example.com/"}, output_file) == 0
+    assert output_file.read_bytes() == b""
+
+    # other records are copied as is, warcinfo excepted
+    output_file = tmp_path / "filtered.warc"
+    assert filter_warc(warc_file, index_dir, set(), output_file) == 2
+    assert index_warcs([output_file], index_dir) == {output_file: 2}
+    assert get_indexed_uris([output_file], index_dir) == {"http://example.com/"}
+
+
+def write_responses(
+    warc_file: pathlib.Path,
+    responses: list[tuple[str, bytes]],
+    status: str = "200 OK",
+    headers: list[tuple[str, str]] | None = None,
+    content_type: str = "image/png",
+):
+    with open(warc_file, "wb") as fh:
+        writer = WARCWriter(fh, gzip=warc_file.name.endswith(".gz"))
+        for uri, payload in responses:
+            http_headers = StatusAndHeaders(
+                status,
+                [("Content-Type", content_type), *(headers or [])],
+                protocol="HTTP/1.1",
+            )
+            writer.write_record(
+                writer.create_warc_record(
+                    uri,
+                    "response",
+                    payload=io.BytesIO(payload),
+                    http_headers=http_headers,
+                )
+            )
+
+
+@pytest.mark.parametrize("suffix", [".warc", ".warc.gz"])
+def test_dedup_warcs(tmp_path, suffix):
+    first = tmp_path / f"rec-0{suffix}"
+    second = tmp_path / f"rec-1{suffix}"
+    unique = tmp_path / f"rec-2{suffix}"
+    write_responses(first, [("https://a.test/logo.png", b"image")])
+    write_responses(
+        second,
+        [
+            ("https://b.test/logo.png", b"image"),
+            ("https://a.test/logo.png", b"image"),
+            ("https://b.test/other.png", b"other"),
+        ],
+    )
+    # same payload, but another mimetype
+    write_responses(
+        unique, [("https://c.test/logo.bin", b"image")], content_type="image/gif"
+    )
+    index_dir = tmp_path / "index"
+    index_warcs([first, second, unique], index_dir)
+    output_dir = tmp_path / "dedup"
+    output_dir.mkdir()
+
+    dedup_files, nb_duplicates = dedup_warcs(
+        [first, second, unique], index_dir, output_dir
+    )
+    assert nb_duplicates == 2
+    # only WARC files holding duplicates are rewritten
+    assert dedup_files == [first, output_dir / f"00001-rec-1{suffix}", unique]
+
+    with open(dedup_files[1], "rb") as fh:
+        records = [
+            (
+                record.rec_type,
+                record.rec_headers.get_header("WARC-Target-URI"),
+                record.rec_headers.get_header("WARC-Refers-To-Target-URI"),
+                record.http_headers.get_header("Content-Type"),
+                record.content_stream().read(),
+            )
+            for record in ArchiveIterator(fh)
+        ]
+    # same URL with the same payload is dropped, other URL is a revisit
+    assert records == [
+        (
+            "revisit",
+            "https://b.test/logo.png",
+            "https://a.test/logo.png",
+            "image/png",
+            b"",
+        ),
+        ("response", "https://b.test/other.png", None, "image/png", b"other"),
+    ]
+
+
+def test_dedup_warcs_ignores_rewritten_content(tmp_path):
+    first = tmp_path / "rec-0.warc"
+    second = tmp_path / "rec-1.warc"
+    # relative links of the same stylesheet are rewritten differently by warc2zim
+    stylesheet = b"body { background: url(../img/bg.png); }"
+    write_responses(
+        first, [("https://a.test/css/style.css", stylesheet)], content_type="text/css"
+    )
+    write_responses(
+        second,
+        [("https://a.test/v2/css/style.css", stylesheet)],
+        content_type="text/css",
+    )
+    index_dir = tmp_path / "index"
+    index_warcs([first, second], index_dir)
+    output_dir = tmp_path / "dedup"
+    output_dir.mkdir()
+
+    dedup_files, nb_duplicates = dedup_warcs([first, second], index_dir, output_dir)
+    assert nb_duplicates == 0
+    assert dedup_files == [first, second]
+
+
+def test_dedup_warcs_ignores_redirects(tmp_path):
+    first = tmp_path / "rec-0.warc"
+    second = tmp_path / "rec-1.warc"
+    # empty payloads share the same digest, but locations differ
+    write_responses(
+        first, [("https://a.test/a", b"")], "302 Found", [("Location", "/x")]
+    )
+    write_responses(
+        second, [("https://a.test/b", b"")], "302 Found", [("Location", "/y")]
+    )
+    index_dir = tmp_path / "index"
+    index_warcs([first, second], index_dir)
+    output_dir = tmp_path / "dedup"
+    output_dir.mkdir()
+
+    dedup_files, nb_duplicates = dedup_warcs([first, second], index_dir, output_dir)
+    assert nb_duplicates == 0
+    assert dedup_files == [first, second]
@@ -0,0 +1,23 @@
+from argparse import ArgumentTypeError
+
+import pytest
+
+from zimit.zimit import parse_exit_codes
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("11", {11}),
+        ("11,12", {11, 12}),
+        (" 11, 12 ,", {11, 12}),
+        ("", set()),
+    ],
+)
+def test_parse_exit_codes(value: str, expected: set[int]):
+    assert parse_exit_codes(value) == expected
+
+
+def test_parse_exit_codes_invalid():
+    with pytest.raises(ArgumentTypeError):
+        parse_exit_codes("11,abc")